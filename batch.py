@@ -0,0 +1,184 @@
+import os
+import csv
+import json
+import argparse
+from multiprocessing import get_context
+from timeit import default_timer as timer
+
+import report as rp
+
+
+# instance directories of a batch, source is either a directory whose subdirectories each hold the csv files of a
+# tournament (directly or in an input_files subdirectory) or a manifest file listing one such directory per line
+# (relative to the manifest, blank lines and lines starting with # are skipped), instance bundles (.npz files, see
+# data.save_bundle) can be used instead of directories
+# returns (name, directory) pairs, names are unique and used for the output directories
+def instance_directories(source):
+    if os.path.isfile(source):
+        base = os.path.dirname(os.path.abspath(source))
+
+        with open(source) as file:
+            paths = [os.path.join(base, line.strip()) for line in file
+                     if line.strip() and not line.strip().startswith("#")]
+    else:
+        paths = [os.path.join(source, name) for name in sorted(os.listdir(source))
+                 if os.path.isdir(os.path.join(source, name)) or name.endswith(".npz")]
+
+    instances = []
+
+    for path in paths:
+        directory = os.path.join(path, "input_files")
+        directory = directory if os.path.isdir(directory) else path
+
+        if os.path.exists(os.path.join(directory, "SupExaAssign.csv")) or \
+                (directory.endswith(".npz") and os.path.isfile(directory)):
+            name = os.path.basename(os.path.normpath(path)).removesuffix(".npz")
+            name = os.path.basename(os.path.dirname(os.path.normpath(path))) if name == "input_files" else name
+            names = [instance[0] for instance in instances]
+            instances.append((name if name not in names else f"{name}_{len(instances)}", directory))
+
+    return instances
+
+
+# load the solver once per worker process and compile its numba kernels, so no instance solved by the worker pays
+# the imports or the JIT (or cache loading), workers never import the plotting libraries (see report.py)
+# the batch already runs one worker per core, so parallel numba kernels use a single thread per worker
+def initialize_worker():
+    from numba import set_num_threads
+    set_num_threads(1)
+
+    import hybrid_system as hs
+    hs.warm_up()
+
+
+# json result of a previous run in an output directory (the latest one), None if there is none
+def previous_result(output):
+    results = sorted(name for name in os.listdir(output) if name.startswith("result [") and name.endswith(".json"))
+    return os.path.join(output, results[-1]) if results else None
+
+
+# solve one instance and write its result csv and json, convergence trace (see convergence.read_samples), stats
+# events and checkpoint (if the config asks for checkpoints) to its output directory
+# returns a summary row with the path of the json result, instances that cannot be loaded or solved (e.g.
+# infeasible ones) get a row with the error instead of failing the batch
+# when resuming, an instance that already has a result is not solved again and an unfinished one continues
+# from its checkpoint
+def solve_instance(task):
+    import data as dt
+    import hybrid_system as hs
+
+    name, directory, output, config = task
+    output = os.path.join(output, name)
+    os.makedirs(output, exist_ok=True)
+    config = dict(config, trace_path=os.path.join(output, "trace.bin"),
+                  stats_stream=os.path.join(output, "stats.jsonl"), verbose=False)
+    row = {"instance": name, "directory": directory, "penalty_point": None, "hard_constraints_violated": None,
+           "soft_constraints_violated": None, "seconds": None, "result": None, "error": None}
+    start = timer()
+
+    if config.get("checkpoint_path") is not None:
+        config["checkpoint_path"] = os.path.join(output, "checkpoint.npz")
+
+    if config.get("resume") and previous_result(output) is not None:
+        row["result"] = previous_result(output)
+
+        with open(row["result"]) as file:
+            result = json.load(file)
+
+        row.update({key: result[key]
+                    for key in ["penalty_point", "hard_constraints_violated", "soft_constraints_violated"]})
+        return row
+
+    try:
+        geometry, instance = dt.load_tournament(directory)
+        result = hs.solve(instance, config)
+    except Exception as error:  # missing or malformed files, infeasible tournaments
+        row["error"] = f"{type(error).__name__}: {error}"
+        return row
+
+    # result files are named with the run id in the current directory
+    working_directory = os.getcwd()
+    os.chdir(output)
+
+    try:
+        run_id = dt.write_schedule(result["candidate"], instance)
+        row["result"] = os.path.join(output, dt.write_result(result, instance, geometry, run_id))
+    finally:
+        os.chdir(working_directory)
+
+    row.update({"penalty_point": int(result["constraint_counts"][0]),
+                "hard_constraints_violated": int(result["constraint_counts"][1]),
+                "soft_constraints_violated": int(result["constraint_counts"][2]),
+                "seconds": timer() - start})
+    return row
+
+
+# solve every instance of a batch on a pool of warm worker processes (one per core by default)
+# each instance runs the single-process hybrid system with config (see hybrid_system.DEFAULT_CONFIG), workers are
+# daemonic and cannot start island or parallel annealing pools of their own, so the batch parallelizes over
+# instances instead; with a seed, instance i is solved with seed + i
+# results go to a subdirectory of output per instance and a summary.csv of all instances, with report the graph
+# and schedule report of each instance are rendered next to its result on a separate reporter process
+# with checkpoint_path set in config (to any path) each instance is checkpointed to checkpoint.npz in its own
+# subdirectory, resume continues a batch that was stopped: finished instances keep their results, the others
+# continue from their checkpoints (or start over if they have none)
+def batch(source, output="batch_results", config=None, processes=None, report=True, resume=False):
+    config = dict(config or {}, resume=resume)
+
+    if config.get("island_no", 1) > 1 or config.get("annealing", "single") != "single":
+        raise ValueError("batch instances are solved in one process each, island_no must be 1 and annealing single")
+
+    instances = instance_directories(source)
+    output = os.path.abspath(output)
+    os.makedirs(output, exist_ok=True)
+    seed = config.get("seed")
+    tasks = [(name, os.path.abspath(directory), output,
+              dict(config, seed=None if seed is None else seed + index))
+             for index, (name, directory) in enumerate(instances)]
+    rows = []
+    reports = []
+    start = timer()
+    reporter = rp.create_reporter() if report else None
+
+    with get_context("spawn").Pool(processes, initializer=initialize_worker) as pool:
+        for row in pool.imap_unordered(solve_instance, tasks):
+            rows.append(row)
+            status = f"Error: {row['error']}" if row["error"] else \
+                f"Final Penalty: {row['penalty_point']} Previous result" if row["seconds"] is None else \
+                f"Final Penalty: {row['penalty_point']} Time: {round(row['seconds'], 2)} seconds"
+            print(f"[{len(rows)}/{len(tasks)}] [{row['instance']}] {status}")
+
+            if reporter is not None and row["result"] is not None:
+                reports.append(rp.submit(reporter, row["result"]))
+
+    if reporter is not None:
+        reporter.close()
+        reporter.join()
+
+        for pending_report in reports:
+            pending_report.get()  # raise the errors of the reporter
+
+    rows.sort(key=lambda row: row["instance"])
+
+    with open(os.path.join(output, "summary.csv"), 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=list(rows[0]) if rows else ["instance"])
+        writer.writeheader()
+        writer.writerows(rows)
+
+    print(f"\nSolved {sum(row['error'] is None for row in rows)} of {len(rows)} instances in "
+          f"{round(timer() - start, 2)} seconds")
+    return rows
+
+
+# guarded so the spawned worker processes do not start a batch themselves
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Solve a batch of tournaments on a pool of worker processes")
+    parser.add_argument("source", help="directory of instance directories or manifest file")
+    parser.add_argument("--output", default="batch_results")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--config", default=None, help="json object of hybrid_system options")
+    parser.add_argument("--no-report", action="store_true", help="only write the results, no graphs or tables")
+    parser.add_argument("--resume", action="store_true", help="continue a stopped batch in the same output")
+    arguments = parser.parse_args()
+    batch(arguments.source, arguments.output, json.loads(arguments.config) if arguments.config else None,
+          arguments.processes, not arguments.no_report, arguments.resume)
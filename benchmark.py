@@ -0,0 +1,143 @@
+import os
+import csv
+import json
+import argparse
+import numpy as np
+from timeit import default_timer as timer
+
+import data as dt
+from penalty_function import penalty, referee_statistics
+from encoding import slot_index
+import genetic_algorithm as ga
+import simulated_annealing as sa
+
+
+# generate a synthetic tournament in the same csv format as input_files
+# unavailability is the probability that a referee (HC04) or venue (HC03) is unavailable for a slot
+def generate_instance(directory, match_no=30, referee_no=15, venue_no=4, day_no=5, time_slot_no=5,
+                      unavailability=0.05, seed=0):
+    rng = np.random.default_rng(seed)
+    slot_no = day_no * venue_no * time_slot_no
+    input_directory = os.path.join(directory, "input_files")
+    os.makedirs(input_directory, exist_ok=True)
+    referees = [f"R{str(referee + 1).zfill(3)}" for referee in range(referee_no)]
+
+    def write_rows(filename, rows):
+        with open(os.path.join(input_directory, filename), 'w', newline='') as file:
+            csv.writer(file).writerows(rows)
+
+    write_rows("Geometry.csv", [["Days"] + [f"D{day + 1}" for day in range(day_no)],
+                                ["Venues"] + [f"G{venue + 1}" for venue in range(venue_no)],
+                                ["Times"] + [f"T{time_slot + 1}" for time_slot in range(time_slot_no)]])
+
+    # every match is supervised by 3 different referees
+    write_rows("SupExaAssign.csv", [["#", "Referee", "Examiner 1", "Examiner 2"]] +
+               [[f"M{match + 1}"] + [referees[referee] for referee in rng.choice(referee_no, 3, replace=False)]
+                for match in range(match_no)])
+
+    # venue unavailability, slots are numbered day by day, venue by venue and time slot by time slot
+    venue_rows = []
+
+    for venue in range(venue_no):
+        slots = [day * venue_no * time_slot_no + venue * time_slot_no + time_slot
+                 for day in range(day_no) for time_slot in range(time_slot_no)]
+        venue_rows.append([f"G{venue + 1}"] + [slot + 1 for slot in slots if rng.random() < unavailability])
+
+    write_rows("HC03.csv", venue_rows)
+    write_rows("HC04.csv", [[referee] + [slot + 1 for slot in range(slot_no) if rng.random() < unavailability]
+                            for referee in referees])
+    write_rows("SC01.csv", [[referee, rng.integers(2, 5)] for referee in referees])
+    write_rows("SC02.csv", [[referee, rng.integers(1, day_no + 1)] for referee in referees])
+    write_rows("SC03.csv", [[referee, "yes" if rng.random() < 0.5 else "no"] for referee in referees])
+
+
+# run all phases of the hybrid system on the instance in the current directory and time each of them
+# evaluations are full penalty evaluations in the GA and incremental (delta) evaluations in SA
+def run(population_size=10, ga_max_generations=100, seed=0, seeding="random"):
+    np.random.seed(seed)
+    sa.seed(seed)
+    phases = {}
+    convergence = []
+    start = timer()
+
+    phase_start = timer()
+    geometry, instance = dt.load_tournament()
+    phases["load"] = {"seconds": timer() - phase_start}
+
+    phase_start = timer()
+    population, penalty_points = ga.initial_population(population_size, instance, seeding)
+    phases["init_population"] = {"seconds": timer() - phase_start, "evaluations": population_size}
+    convergence.append((timer() - start, int(penalty_points[0])))
+
+    phase_start = timer()
+    population, penalty_points, ga_plot_data = \
+        ga.reproduction(ga_max_generations, population, penalty_points, instance, verbose=False)
+    phases["ga"] = {"seconds": timer() - phase_start, "evaluations": 2 * ga_max_generations}
+    convergence.append((timer() - start, int(penalty_points[0])))
+
+    phase_start = timer()
+    temperature = penalty_points[-1] - penalty_points[0]
+    best_candidate, best_penalty_point, sa_plot_data, operator_statistics = \
+        sa.anneal(temperature, population[0], penalty_points[0], instance, verbose=False)
+    phases["sa"] = {"seconds": timer() - phase_start, "evaluations": len(sa_plot_data),
+                    "operators": operator_statistics.tolist()}  # columns of instrumentation.OPERATOR_COLUMNS
+    convergence.append((timer() - start, int(best_penalty_point)))
+
+    phase_start = timer()
+    constraint_counts = penalty(best_candidate, slot_index(best_candidate, instance.available.shape[0]), instance)
+    statistics = referee_statistics(best_candidate, instance)
+    dt.write(best_candidate, instance, geometry, statistics, constraint_counts,
+             np.concatenate([ga_plot_data, sa_plot_data]), verbose=False)
+    phases["write"] = {"seconds": timer() - phase_start}
+
+    for phase in phases.values():
+        if "evaluations" in phase:
+            phase["evaluations_per_second"] = phase["evaluations"] / max(phase["seconds"], 1e-9)
+
+    return {"phases": phases,
+            "total_seconds": timer() - start,
+            "final_penalty": int(constraint_counts[0]),
+            "hard_constraints_violated": int(constraint_counts[1]),
+            "soft_constraints_violated": int(constraint_counts[2]),
+            "convergence": convergence}  # (seconds since start, best penalty point) after each phase
+
+
+# generate a synthetic instance, solve it and append the measurements as a json line to the output file
+def benchmark(directory, output, repeat=1, seed=0, seeding="random", **instance_size):
+    generate_instance(directory, seed=seed, **instance_size)
+    working_directory = os.getcwd()
+    output = os.path.abspath(output)
+    os.chdir(directory)
+
+    try:
+        for run_no in range(repeat):
+            result = run(seed=seed + run_no, seeding=seeding)
+            result.update({"instance": dict(instance_size, seed=seed), "run": run_no, "seeding": seeding})
+
+            with open(output, 'a') as file:
+                file.write(json.dumps(result) + "\n")
+
+            print(f"[Run {run_no + 1}] Final Penalty: {result['final_penalty']} "
+                  f"Time: {round(result['total_seconds'], 2)} seconds")
+    finally:
+        os.chdir(working_directory)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the hybrid system on a synthetic tournament")
+    parser.add_argument("--matches", type=int, default=30)
+    parser.add_argument("--referees", type=int, default=15)
+    parser.add_argument("--venues", type=int, default=4)
+    parser.add_argument("--days", type=int, default=5)
+    parser.add_argument("--time-slots", type=int, default=5)
+    parser.add_argument("--unavailability", type=float, default=0.05)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--seeding", choices=["random", "greedy"], default="random")
+    parser.add_argument("--directory", default="benchmark_instance")
+    parser.add_argument("--output", default="benchmark_results.jsonl")
+    arguments = parser.parse_args()
+    benchmark(arguments.directory, arguments.output, arguments.repeat, arguments.seed, arguments.seeding,
+              match_no=arguments.matches, referee_no=arguments.referees, venue_no=arguments.venues,
+              day_no=arguments.days, time_slot_no=arguments.time_slots,
+              unavailability=arguments.unavailability)
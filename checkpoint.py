@@ -0,0 +1,58 @@
+import os
+import numpy as np
+from collections import namedtuple
+from timeit import default_timer as timer
+
+# periodic checkpoints of a run, saved as an uncompressed .npz file at path at most every interval seconds
+# state holds the time of the last save
+Checkpoint = namedtuple("Checkpoint", ["path", "interval", "state"])
+
+
+# create a checkpoint, the first save is due after interval seconds
+def create_checkpoint(path, interval=60):
+    return Checkpoint(path, interval, {"saved": timer()})
+
+
+# check if a checkpoint should be saved now, never for None
+def due(checkpoint):
+    return checkpoint is not None and timer() - checkpoint.state["saved"] >= checkpoint.interval
+
+
+# save the phase ("ga" or "sa") of a run, its arrays, the state of numpy's random generator, the convergence
+# trace kept by recorder (see convergence.py) and the state of budget (see stopping.resume_budget) if there are any
+# the file is replaced atomically, so a run killed while saving leaves the previous checkpoint intact
+def save(checkpoint, phase, recorder=None, budget=None, **arrays):
+    name, keys, position, has_gauss, cached_gaussian = np.random.get_state()
+    arrays.update(phase=phase, random_keys=keys, random_state=[position, has_gauss], random_gauss=cached_gaussian)
+
+    if recorder is not None:
+        if recorder.file is not None:
+            recorder.file.flush()  # the trace file must hold every sample of the checkpoint
+
+        state = recorder.state
+        arrays.update(trace_buffer=recorder.buffer,
+                      trace_state=[state["samples"], state["iterations"],
+                                   -1 if state["last"] is None else state["last"], state["last"] is not None])
+
+    if budget is not None:
+        state = budget.state
+        arrays.update(budget_state=[timer() - state["start"], state["evaluations"],
+                                    -1 if state["best"] is None else state["best"], state["best"] is not None,
+                                    state["stagnant"]])
+
+    with open(checkpoint.path + ".tmp", 'wb') as file:
+        np.savez(file, **arrays)
+
+    os.replace(checkpoint.path + ".tmp", checkpoint.path)
+    checkpoint.state["saved"] = timer()
+
+
+# load a checkpoint as a dictionary of arrays and restore the state of numpy's random generator
+def load(path):
+    with np.load(path) as file:
+        arrays = {name: file[name] for name in file.files}
+
+    np.random.set_state(("MT19937", arrays["random_keys"], int(arrays["random_state"][0]),
+                         int(arrays["random_state"][1]), float(arrays["random_gauss"])))
+    arrays["phase"] = str(arrays["phase"])
+    return arrays
@@ -0,0 +1,109 @@
+import os
+import numpy as np
+from collections import namedtuple
+
+# downsampled convergence trace of a run, samples are (iteration, penalty point) pairs kept in a ring buffer
+# (the oldest samples are overwritten once capacity is reached) and appended to a binary file if one is open
+# every keeps every n-th iteration, change_points keeps only iterations where the penalty point changes
+# state holds the number of samples and iterations recorded so far and the last penalty point
+Recorder = namedtuple("Recorder", ["buffer", "every", "change_points", "file", "state"])
+
+
+# create a recorder, samples are also written as int64 pairs to path if it is given
+def create_recorder(capacity=65536, every=1, change_points=False, path=None):
+    return Recorder(np.zeros((capacity, 2), dtype=np.int64), every, change_points,
+                    open(path, 'wb') if path is not None else None,
+                    {"samples": 0, "iterations": 0, "last": None})
+
+
+# record the penalty points of consecutive iterations
+def record(recorder, penalty_points):
+    record_steps(recorder, np.arange(len(penalty_points)), penalty_points, len(penalty_points))
+
+
+# record a trace of length iterations given by its steps, the iterations (from 0, counted from the start of the
+# trace) where the penalty point may change and the penalty point from each of them on, e.g. the samples of a
+# change-point recorder; the trace is recorded as if the penalty point of every iteration were passed to record
+def record_steps(recorder, iterations, penalty_points, length):
+    iterations = np.asarray(iterations, dtype=np.int64)
+    penalty_points = np.asarray(penalty_points, dtype=np.int64)
+    state = recorder.state
+
+    if length == 0:
+        return
+
+    if recorder.change_points:
+        previous = np.concatenate([[penalty_points[0] + 1 if state["last"] is None else state["last"]],
+                                   penalty_points[:-1]])
+        keep = penalty_points != previous
+        sample_iterations, sample_points = iterations[keep], penalty_points[keep]
+    else:
+        sample_iterations = np.arange((-state["iterations"]) % recorder.every, length, recorder.every)
+        sample_points = penalty_points[np.searchsorted(iterations, sample_iterations, "right") - 1]
+
+    samples = np.stack([state["iterations"] + sample_iterations, sample_points], axis=1)
+    capacity = len(recorder.buffer)
+
+    if recorder.file is not None:
+        recorder.file.write(samples.tobytes())
+
+    # only the last capacity samples fit in the ring buffer
+    positions = (state["samples"] + np.arange(len(samples))) % capacity
+    recorder.buffer[positions[-capacity:]] = samples[-capacity:]
+    state["samples"] += len(samples)
+    state["iterations"] += length
+    state["last"] = int(penalty_points[-1])
+
+
+# final sample of the trace, the last iteration is always part of the trace even if it is not sampled
+def final_sample(recorder):
+    state = recorder.state
+
+    if state["last"] is None or (state["samples"] > 0 and
+                                 recorder.buffer[(state["samples"] - 1) % len(recorder.buffer)][0] ==
+                                 state["iterations"] - 1):
+        return np.empty((0, 2), dtype=np.int64)
+
+    return np.array([[state["iterations"] - 1, state["last"]]], dtype=np.int64)
+
+
+# iterations and penalty points of the samples in the ring buffer in recording order
+def samples(recorder):
+    count = recorder.state["samples"]
+    capacity = len(recorder.buffer)
+    buffer = recorder.buffer[:count] if count <= capacity else np.roll(recorder.buffer, -(count % capacity), axis=0)
+    buffer = np.concatenate([buffer, final_sample(recorder)])
+    return buffer[:, 0], buffer[:, 1]
+
+
+# recorder continuing the trace saved with a checkpoint (see checkpoint.save), a trace file at path is cut back to
+# the samples recorded up to the checkpoint and appended to
+def restore(arrays, every=1, change_points=False, path=None):
+    samples, iterations, last, has_last = (int(value) for value in arrays["trace_state"])
+    file = None
+
+    if path is not None:
+        file = open(path, 'r+b' if os.path.exists(path) else 'wb')
+        file.truncate(min(samples * 16, os.path.getsize(path)))  # 2 int64 per sample
+        file.seek(0, os.SEEK_END)
+
+    return Recorder(np.copy(arrays["trace_buffer"]), every, change_points, file,
+                    {"samples": samples, "iterations": iterations, "last": last if has_last else None})
+
+
+# write the final sample and close the file of a recorder
+def close(recorder):
+    if recorder.file is not None:
+        recorder.file.write(final_sample(recorder).tobytes())
+        recorder.file.close()
+
+
+# iterations and penalty points of a trace file written by a recorder
+def read_samples(path):
+    buffer = np.fromfile(path, dtype=np.int64).reshape(-1, 2)
+    return buffer[:, 0], buffer[:, 1]
+
+
+# best penalty point of every iteration of a trace of length iterations given by its steps (see record_steps)
+def expand(iterations, penalty_points, length):
+    return np.repeat(penalty_points, np.diff(np.append(iterations, length)))
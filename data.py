@@ -1,174 +1,435 @@
 import csv
+import json
+import uuid
 import numpy as np
-import matplotlib.pyplot as plt
-from prettytable import PrettyTable
+import os
+from collections import namedtuple, deque
 from datetime import datetime as date
-
-
-#  load data from csv files
-def load():
-    slot_no = 100
-    referee_no = 15
-    match_no = 30
+from encoding import slot_index
+
+
+# problem instance consumed by all operators and penalty kernels
+# adjacency lists are stored in CSR layout, e.g. the matches of referee r are
+# referee_matches[referee_pointer[r]:referee_pointer[r + 1]]
+Instance = namedtuple("Instance", ["available",  # slot × match availability mask (HC03, HC04)
+                                   "match_match",  # 1 if 2 matches share a referee
+                                   "match_referee",  # 1 if a referee supervises a match
+                                   "referee_preference",  # SC01, SC02 and SC03 preferences of each referee
+                                   "referee_pointer", "referee_matches",  # referee → matches
+                                   "match_pointer", "match_referees",  # match → referees
+                                   "conflict_pointer", "conflict_matches",  # match → matches sharing a referee
+                                   "available_pointer", "available_slots",  # match → available slots
+                                   "slot_day", "slot_time", "slot_venue",  # slot → day, time slot and venue
+                                   "concurrent_slots",  # slot → slots on the same day and time slot
+                                   "day_no", "time_slot_no", "venue_no",
+                                   # published match → slot schedule (-1 if unpublished) and penalty points for
+                                   # each match moved away from it (see reschedule.py)
+                                   "published_slots", "move_weight"])
+
+# names of the days, venues and time slots of a tournament, their numbers define the calendar geometry
+Geometry = namedtuple("Geometry", ["days", "venues", "time_slots"])
+DEFAULT_GEOMETRY = Geometry(("Mon", "Tues", "Wed", "Thu", "Fri"),
+                            ("G1", "G2", "G3", "G4"),
+                            ("0800-0930", "1000-1130", "1200-0130", "0200-0330", "0400-0530"))
+
+
+# build CSR adjacency (pointer, indices) of the non-zero entries of each row of a matrix
+def adjacency(matrix):
+    rows, columns = np.nonzero(matrix)
+    pointer = np.zeros(matrix.shape[0] + 1, dtype=np.int64)
+    pointer[1:] = np.cumsum(np.bincount(rows, minlength=matrix.shape[0]))
+    return pointer, columns.astype(np.int64)
+
+
+# all pairs of entries in the same row of a CSR adjacency (each entry is also paired with itself),
+# e.g. the pairs of matches supervised by the same referee
+def row_pairs(pointer, indices):
+    sizes = np.diff(pointer)
+    entry_sizes = np.repeat(sizes, sizes)  # size of the row of each entry
+    first = np.repeat(np.arange(len(indices)), entry_sizes)
+    offsets = np.arange(len(first)) - np.repeat(np.cumsum(entry_sizes) - entry_sizes, entry_sizes)
+    second = np.repeat(np.repeat(pointer[:-1], sizes), entry_sizes) + offsets
+    return indices[first], indices[second]
+
+
+# read tournament geometry (names of days, venues and time slots) from Geometry.csv or from a bundle (.npz)
+# the default geometry of 5 days × 4 venues × 5 time slots is used if the file does not exist
+def load_geometry(directory="input_files"):
+    if directory.endswith(".npz"):
+        return load_bundle(directory)[0]
+
+    geometry = {"Days": DEFAULT_GEOMETRY.days,
+                "Venues": DEFAULT_GEOMETRY.venues,
+                "Times": DEFAULT_GEOMETRY.time_slots}
+
+    if os.path.exists(os.path.join(directory, "Geometry.csv")):
+        with open(os.path.join(directory, "Geometry.csv")) as file:
+            csv_reader = csv.reader(file, delimiter=',')
+
+            for row in csv_reader:
+                geometry[row[0]] = tuple(row[1:])
+
+    return Geometry(geometry["Days"], geometry["Venues"], geometry["Times"])
+
+
+#  load data from csv files in a directory, or the instance of a bundle if directory is a .npz file
+# slots are numbered day by day, venue by venue and time slot by time slot as given by the geometry
+def load(directory="input_files", geometry=None):
+    if directory.endswith(".npz"):
+        return load_bundle(directory)[1]
+
+    geometry = load_geometry(directory) if geometry is None else geometry
+    slot_no = len(geometry.days) * len(geometry.venues) * len(geometry.time_slots)
     preference_no = 3
-    match_referee = np.zeros([match_no, referee_no], dtype=np.int8)
-    referee_slot = np.zeros([referee_no, slot_no], dtype=np.int8)
-    referee_preference = np.zeros([referee_no, 2 * preference_no], dtype=np.int8)
 
     # read supExaAssign.csv
-    with open('input_files\SupExaAssign.csv') as file:
+    with open(os.path.join(directory, "SupExaAssign.csv")) as file:
         csv_reader = csv.reader(file, delimiter=',')
         next(csv_reader)
+        assignments = [(int(row[0][1:]) - 1,  # only underscores in M___ will be considered
+                        [int(row[col][1:]) - 1 for col in range(1, 4)])  # only digits in R___ will be considered
+                       for row in csv_reader]
 
-        for row in csv_reader:
-            i = int(row[0][1:]) - 1  # only underscores in M___ will be considered
+    # number of matches and referees is taken from the largest ids in the input files
+    match_no = max(match for match, _ in assignments) + 1
+    referee_no = max(max(referees) for _, referees in assignments) + 1
 
-            for col in range(1, 4):
-                j = int(row[col][2:]) - 1  # only underscores in R0__ will be considered
-                match_referee[i][j] = 1
+    for filename in ["HC04.csv", "SC01.csv", "SC02.csv", "SC03.csv"]:
+        with open(os.path.join(directory, filename)) as file:
+            csv_reader = csv.reader(file, delimiter=',')
+            referee_no = max([referee_no] + [int(row[0][1:]) for row in csv_reader])
 
-    match_match = np.dot(match_referee, match_referee.transpose())
-    # presentations supervised by same examiners are marked with 1
-    match_match[match_match >= 1] = 1
-    np.fill_diagonal(match_match, 0)  # mark diagonal with 0 so penalty points can be calculated correctly
+    match_referee = np.zeros([match_no, referee_no], dtype=np.int8)
+    referee_slot = np.zeros([referee_no, slot_no], dtype=np.int8)
+    referee_preference = np.zeros([referee_no, preference_no], dtype=np.int8)
+    closed_slots = np.zeros(slot_no, dtype=bool)
+
+    for i, referees in assignments:
+        match_referee[i, referees] = 1
 
     # read HC04.csv (staff unavailability)
-    with open('input_files\HC04.csv') as file:
+    with open(os.path.join(directory, "HC04.csv")) as file:
         csv_reader = csv.reader(file, delimiter=',')
 
         for row in csv_reader:
-            i = int(row[0][2:]) - 1  # only underscores in R0__ will be considered
+            i = int(row[0][1:]) - 1  # only digits in R___ will be considered
             j = [int(_) - 1 for _ in row[1:]]
             referee_slot[i][j] = 1
 
-    slot_match = np.dot(referee_slot.transpose(), match_referee.transpose())
-    slot_match[slot_match >= 1] = -1  # unavailable slots for presentation are marked with -1
-
     # read HC03.csv (venue unavailability)
-    with open('input_files\HC03.csv') as file:
+    with open(os.path.join(directory, "HC03.csv")) as file:
         csv_reader = csv.reader(file, delimiter=',')
 
         for row in csv_reader:
             i = [int(_) - 1 for _ in row[1:]]
-            slot_match[i, :] = -1  # unavailable slots for presentation are marked with -1
+            closed_slots[i] = True
 
     # read SC01.csv (consecutive presentations)
-    with open('input_files\SC01.csv') as file:
+    with open(os.path.join(directory, "SC01.csv")) as file:
         csv_reader = csv.reader(file, delimiter=',')
 
         for row in csv_reader:
-            i = int(row[0][2:]) - 1  # only underscores in R0__ will be considered
+            i = int(row[0][1:]) - 1  # only digits in R___ will be considered
             referee_preference[i][0] = int(row[1])
 
     # read SC02.csv (number of days)
-    with open('input_files\SC02.csv') as file:
+    with open(os.path.join(directory, "SC02.csv")) as file:
         csv_reader = csv.reader(file, delimiter=',')
 
         for row in csv_reader:
-            i = int(row[0][2:]) - 1  # only underscores in R0__ will be considered
+            i = int(row[0][1:]) - 1  # only digits in R___ will be considered
             referee_preference[i][1] = int(row[1])
 
     # read SC03.csv (change of venue)
-    with open('input_files\SC03.csv') as file:
+    with open(os.path.join(directory, "SC03.csv")) as file:
         csv_reader = csv.reader(file, delimiter=',')
 
         for row in csv_reader:
-            i = int(row[0][2:]) - 1  # only underscores in R0__ will be considered
+            i = int(row[0][1:]) - 1  # only digits in R___ will be considered
             referee_preference[i][2] = 1 if row[1] == "yes" else 0
 
-    return slot_match, match_match, match_referee, referee_preference
-
-
-# write result to csv file with timestamp
-def write(slot_match, referee_preference, constraints_count, plot_data):
-    timestamp = date.now().strftime("[%Y-%m-%d %H-%M-%S]")
-
-    # plot graph
-    title = (f"Improvement of match Scheduling over Iterations\n"
-             f"[Hard Constraints Violated:] {constraints_count[1]} "
-             f"[Soft Constraints Violated:] {constraints_count[2]}\n"
-             f"[Final Penalty Points:] {constraints_count[0]}")
-    plt.title(title)
-    plt.xlabel("Number of Iterations")
-    plt.ylabel("Penalty Points")
-    plt.axis([0, len(plot_data), 0, max(plot_data)])
-    plt.plot(plot_data, "r--")
-    plt.grid(True)
-    plt.ioff()
-    plt.show()
-    graph_name = f"graph {timestamp}"
-    plt.savefig(graph_name)
-
-    # draw schedule
-    venue_no = 4
-    time_slot_no = 5
-    day_slot_no = venue_no * time_slot_no
-    day_no = 5
-    slot_no = day_slot_no * day_no
-    venues = ["G1", "G2", "G3", "G4"]
-    days = ["Mon", "Tues", "Wed", "Thu", "Fri"]
-
-    schedule = PrettyTable()
-    schedule.field_names = ["Day", "Venue",
-                            "0800-0930", "1000-1130", "1200-0130",
-                            "0200-0330", "0400-0530"]
-
-    venue = 0
-    day = 0
-
-    for first_slot in range(0, slot_no, time_slot_no):
-        row = []
-
-        if venue == 0:
-            row.append(days[day])
-        else:
-            row.append("")
-
-        row.append(venues[venue])
-
-        for slot in range(first_slot, first_slot + time_slot_no):
-            match = np.where(slot_match[slot] == 1)[0]
-
-            if len(match) == 0:
-                row.append("")
-            else:
-                match = match[0] + 1
-                row.append("M" + str(match))
-
-        schedule.add_row(row)
-        venue += 1
-
-        if venue == venue_no:
-            venue = 0
-            day += 1
-            schedule.add_row([""] * (2 + time_slot_no))
-
-    print("\n", schedule, "\n")
-
-    # print supervisor-related data
-    referee_no = referee_preference.shape[0]
-
-    for referee in range(referee_no):
-        venue_preference = "No" if referee_preference[referee][2] else "Yes"
-
-        print(f"[Referee R{str(referee + 1).zfill(3)}] "
-              f"[No. of Continuous matches: {referee_preference[referee][3]}] "
-              f"[Day Preference: {referee_preference[referee][1]}] "
-              f"[Days: {referee_preference[referee][4]}] "
-              f"[Venue Change Preference: {venue_preference}] "
-              f"[Venue Changes: {referee_preference[referee][5]}]")
-
-    # write result data to csv file with timestamp
-    filename = f"result {timestamp}.csv"
-
-    with open(filename, 'w', newline='') as file:
-        writer = csv.writer(file)
-
-        for slot in range(slot_match.shape[0]):
-            match = np.where(slot_match[slot] == 1)[0]
-
-            if len(match) == 0:  # empty if no presentation is found for the slot
-                writer.writerow(["null", ""])
-            else:
-                match = match[0] + 1  # Access x in array([x])
-                writer.writerow(["M" + str(match), ""])
+    return create_instance(geometry, match_referee, referee_slot, closed_slots, referee_preference)
+
+
+# load the geometry and instance of a directory or bundle, a bundle is only read once
+def load_tournament(directory="input_files"):
+    if directory.endswith(".npz"):
+        return load_bundle(directory)
+
+    geometry = load_geometry(directory)
+    return geometry, load(directory, geometry)
+
+
+# write an instance and its geometry to a single uncompressed .npz bundle, loading the bundle takes milliseconds
+# as it skips parsing the csv files, building the indexes and checking feasibility
+def save_bundle(path, instance, geometry):
+    with open(path, 'wb') as file:
+        np.savez(file, days=np.array(geometry.days), venues=np.array(geometry.venues),
+                 time_slots=np.array(geometry.time_slots), **instance._asdict())
+
+
+# read the geometry and instance of a bundle written by save_bundle
+def load_bundle(path):
+    with np.load(path) as file:
+        geometry = Geometry(tuple(file["days"].tolist()), tuple(file["venues"].tolist()),
+                            tuple(file["time_slots"].tolist()))
+        fields = {field: file[field] for field in Instance._fields}
+
+    for field in ["day_no", "time_slot_no", "venue_no", "move_weight"]:
+        fields[field] = int(fields[field])
+
+    return geometry, Instance(**fields)
+
+
+# check that every match can be given its own available slot (a matching of matches to slots exists),
+# so the operators cannot get stuck on an infeasible tournament; raises ValueError otherwise
+def check_feasibility(available_pointer, available_slots, slot_no):
+    match_no = len(available_pointer) - 1
+    unplaceable = [match + 1 for match in range(match_no) if available_pointer[match] == available_pointer[match + 1]]
+    open_slot_no = np.count_nonzero(np.bincount(available_slots, minlength=slot_no))
+
+    if unplaceable:
+        raise ValueError(f"infeasible tournament: no available slot for matches {unplaceable}")
+
+    if open_slot_no < match_no:
+        raise ValueError(f"infeasible tournament: {match_no} matches but only {open_slot_no} available slots")
+
+    # augmenting paths found by breadth-first search, matches with fewest available slots first
+    slot_owner = np.full(slot_no, -1)
+    match_slot = np.full(match_no, -1)
+
+    for match in np.argsort(np.diff(available_pointer), kind="stable"):
+        if not augment(match, available_pointer, available_slots, slot_owner, match_slot):
+            raise ValueError(f"infeasible tournament: match {match + 1} and the matches competing with it "
+                             f"for the same slots cannot all be given an available slot")
+
+
+# give an unplaced match an available slot along the shortest augmenting path found by breadth-first search,
+# every match on the path moves to the next slot of the path, so as few placed matches as possible are moved
+# slot_owner (slot→match) and match_slot (match→slot) mark free slots and unplaced matches with -1 and are updated
+# in place, returns False if no path exists
+def augment(match, available_pointer, available_slots, slot_owner, match_slot):
+    reached_by = np.full(len(slot_owner), -1)  # match from which each slot was reached
+    queue = deque([match])
+
+    while queue:
+        current_match = queue.popleft()
+        slots = available_slots[available_pointer[current_match]:available_pointer[current_match + 1]]
+        slots = slots[reached_by[slots] == -1]
+        reached_by[slots] = current_match
+        free_slots = slots[slot_owner[slots] == -1]
+
+        if len(free_slots) > 0:
+            break
+
+        queue.extend(slot_owner[slots])
+    else:
+        return False
+
+    # move every match on the path to the slot it reached
+    slot = free_slots[0]
+
+    while slot != -1:
+        current_match = reached_by[slot]
+        previous_slot = match_slot[current_match]
+        slot_owner[slot] = current_match
+        match_slot[current_match] = slot
+        slot = previous_slot
+
+    return True
+
+
+# restrict the available slots of an instance after late constraint changes, referee_slots are (referee, slot)
+# pairs of new staff unavailability (HC04) and closed_slots are slots whose venue became unavailable (HC03)
+# raises ValueError if the matches cannot all be given an available slot any more
+def restrict(instance, referee_slots=(), closed_slots=()):
+    available = np.copy(instance.available)
+    available[list(closed_slots), :] = False
+
+    for referee, slot in referee_slots:
+        available[slot, instance.match_referee[:, referee] == 1] = False
+
+    available_pointer, available_slots = adjacency(available.transpose())
+    check_feasibility(available_pointer, available_slots, available.shape[0])
+    return instance._replace(available=available, available_pointer=available_pointer,
+                             available_slots=available_slots)
+
+
+# read late constraint changes from csv files in the format of HC04.csv and HC03.csv (either may be None)
+# returns (referee, slot) pairs of staff unavailability and closed slots for restrict()
+def load_restrictions(hc04=None, hc03=None):
+    referee_slots = []
+    closed_slots = []
+
+    if hc04 is not None:
+        with open(hc04) as file:
+            for row in csv.reader(file, delimiter=','):
+                referee_slots += [(int(row[0][1:]) - 1, int(_) - 1) for _ in row[1:]]  # only digits in R___
+
+    if hc03 is not None:
+        with open(hc03) as file:
+            for row in csv.reader(file, delimiter=','):
+                closed_slots += [int(_) - 1 for _ in row[1:]]
+
+    return referee_slots, closed_slots
+
+
+# read the schedule of a result csv written by write() (or a result written by write_result) as a match→slot
+# chromosome, matches that are not in the result (e.g. added since) get slot -1
+def read_result(path, match_no):
+    chromosome = np.full(match_no, -1, dtype=np.int32)
+
+    if path.endswith(".npz"):
+        with np.load(path) as file:
+            candidate = file["candidate"][:match_no]
+
+        chromosome[:len(candidate)] = candidate
+        return chromosome
+
+    if path.endswith(".json"):
+        with open(path) as file:
+            schedule = json.load(file)["schedule"]
+
+        for entry in schedule:
+            if int(entry["match"][1:]) <= match_no:
+                chromosome[int(entry["match"][1:]) - 1] = entry["slot"] - 1
+
+        return chromosome
+
+    with open(path) as file:
+        for slot, row in enumerate(csv.reader(file, delimiter=',')):
+            if row and row[0] != "null" and int(row[0][1:]) <= match_no:  # only digits in M___ will be considered
+                chromosome[int(row[0][1:]) - 1] = slot
+
+    return chromosome
+
+
+# build a problem instance from in-memory data
+# match_referee (match × referee) and referee_slot (referee × slot, HC04) mark assignments and unavailability with 1,
+# closed_slots marks slots whose venue is unavailable (HC03)
+# raises ValueError if the matches cannot all be given an available slot
+def create_instance(geometry, match_referee, referee_slot, closed_slots, referee_preference):
+    venue_no = len(geometry.venues)
+    time_slot_no = len(geometry.time_slots)
+    day_no = len(geometry.days)
+    slot_no = day_no * venue_no * time_slot_no
+    match_referee = np.asarray(match_referee, dtype=np.int8)
+    referee_preference = np.asarray(referee_preference, dtype=np.int8)
+    match_no = match_referee.shape[0]
+
+    # precompute indexes so they are not rebuilt by every operator and penalty evaluation
+    referee_pointer, referee_matches = adjacency(match_referee.transpose())
+    match_pointer, match_referees = adjacency(match_referee)
+
+    # presentations supervised by same examiners are marked with 1, set from the pairs of matches of each referee
+    # instead of a (match × referee) · (referee × match) product, which dominated loading large tournaments
+    match_match = np.zeros((match_no, match_no), dtype=np.int8)
+    match_match[row_pairs(referee_pointer, referee_matches)] = 1
+    np.fill_diagonal(match_match, 0)  # mark diagonal with 0 so penalty points can be calculated correctly
+
+    # a slot is unavailable for a match if any of its referees is unavailable (HC04) or its venue is closed (HC03)
+    referee_slot = np.asarray(referee_slot, dtype=bool)
+    unavailable = np.zeros((match_no, slot_no), dtype=bool)
+    supervised = np.diff(match_pointer) > 0
+
+    if supervised.any():
+        unavailable[supervised] = np.logical_or.reduceat(referee_slot[match_referees],
+                                                         match_pointer[:-1][supervised], axis=0)
+
+    match_available = ~unavailable & ~np.asarray(closed_slots, dtype=bool)
+    available = np.ascontiguousarray(match_available.transpose())  # slot × match mask shared by all chromosomes
+    conflict_pointer, conflict_matches = adjacency(match_match)
+    available_pointer, available_slots = adjacency(match_available)
+    check_feasibility(available_pointer, available_slots, slot_no)
+    slots = np.arange(slot_no)
+    slot_day = slots // (venue_no * time_slot_no)
+    slot_time = slots % time_slot_no
+    slot_venue = (slots // time_slot_no) % venue_no
+    concurrent_slots = (slot_day * venue_no * time_slot_no + slot_time)[:, np.newaxis] + \
+        np.arange(venue_no) * time_slot_no
+
+    return Instance(available, match_match, match_referee, referee_preference,
+                    referee_pointer, referee_matches, match_pointer, match_referees,
+                    conflict_pointer, conflict_matches, available_pointer, available_slots,
+                    slot_day, slot_time, slot_venue, concurrent_slots,
+                    day_no, time_slot_no, venue_no,
+                    np.full(match_referee.shape[0], -1, dtype=np.int64), 0)
+
+
+# unique id of a run, its start time followed by random digits so parallel runs do not share file names
+def create_run_id():
+    return f"{date.now():%Y-%m-%d %H-%M-%S} {uuid.uuid4().hex[:8]}"
+
+
+# write result to csv file and graph named with the run id (a new one by default), returns the run id
+# the graph (see report.py) is only shown (blocking) if show is set, the schedule is only printed if verbose is set
+# plot_data holds the best penalty point of every iteration or, with plot_iterations, of a downsampled trace
+def write(chromosome, instance, geometry, referee_statistics, constraints_count, plot_data, show=False,
+          verbose=True, plot_iterations=None, run_id=None):
+    import report
+
+    run_id = write_schedule(chromosome, instance, run_id)
+    plot_iterations = np.arange(len(plot_data)) if plot_iterations is None else plot_iterations
+    report.plot_convergence(f"graph [{run_id}].png", plot_iterations, plot_data, constraints_count, show)
+
+    if verbose:
+        print(report.schedule_report(slot_index(chromosome, instance.available.shape[0]), geometry,
+                                     referee_statistics, instance.referee_preference))
+
+    return run_id
+
+
+# write the schedule to a result csv named with the run id (a new one by default) with a row per slot,
+# null if no presentation is found for the slot, returns the run id
+def write_schedule(chromosome, instance, run_id=None):
+    run_id = create_run_id() if run_id is None else run_id
+
+    with open(f"result [{run_id}].csv", 'w', newline='') as file:
+        csv.writer(file).writerows(["null" if match == -1 else f"M{match + 1}", ""]
+                                   for match in slot_index(chromosome, instance.available.shape[0]))
+
+    return run_id
+
+
+# write a result of hybrid_system.solve (or reschedule.reschedule) as json, or as .npz with binary set, named with
+# the run id (a new one by default), returns the file name
+# json holds the schedule (match, slot, day, venue and time slot), penalty points, constraint counts, referee and
+# operator statistics, the stopping reason, the convergence trace and what report.render needs to draw the
+# schedule (geometry and referee preferences), .npz holds the arrays of the result
+def write_result(result, instance, geometry, run_id=None, binary=False):
+    run_id = create_run_id() if run_id is None else run_id
+    candidate = np.asarray(result["candidate"])
+    filename = f"result [{run_id}].{'npz' if binary else 'json'}"
+
+    if binary:
+        with open(filename, 'wb') as file:
+            np.savez(file, run_id=run_id, candidate=candidate, constraint_counts=result["constraint_counts"],
+                     referee_statistics=result["referee_statistics"],
+                     operator_statistics=result["operator_statistics"],
+                     plot_iterations=result["plot_iterations"], plot_data=result["plot_data"])
+
+        return filename
+
+    days = np.array(geometry.days)[instance.slot_day[candidate]].tolist()
+    venues = np.array(geometry.venues)[instance.slot_venue[candidate]].tolist()
+    time_slots = np.array(geometry.time_slots)[instance.slot_time[candidate]].tolist()
+    schedule = [{"match": f"M{match + 1}", "slot": slot + 1, "day": day, "venue": venue, "time": time_slot}
+                for match, (slot, day, venue, time_slot) in enumerate(zip(candidate.tolist(), days, venues,
+                                                                          time_slots))]
+    constraint_counts = np.asarray(result["constraint_counts"]).tolist()
+
+    with open(filename, 'w') as file:
+        json.dump({"run_id": run_id,
+                   "penalty_point": constraint_counts[0],
+                   "hard_constraints_violated": constraint_counts[1],
+                   "soft_constraints_violated": constraint_counts[2],
+                   "stop_reason": result.get("stop_reason"),
+                   "schedule": schedule,
+                   "referee_statistics": np.asarray(result["referee_statistics"]).tolist(),
+                   "operator_statistics": np.asarray(result["operator_statistics"]).tolist(),
+                   "convergence": {"iterations": np.asarray(result["plot_iterations"]).tolist(),
+                                   "penalty_points": np.asarray(result["plot_data"]).tolist()},
+                   "geometry": geometry._asdict(),
+                   "referee_preference": instance.referee_preference.tolist()}, file)
+
+    return filename
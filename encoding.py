@@ -0,0 +1,17 @@
+import numpy as np
+from numba import njit
+
+# a chromosome is a match→slot int array (chromosome[match] = slot)
+# slot→match inverse index (slot_match[slot] = match) marks empty slots with -1
+# availability of slots is a separate slot × match boolean mask shared by all chromosomes
+
+
+# build slot→match inverse index of a chromosome
+@njit(cache=True)
+def slot_index(chromosome, slot_no):
+    slot_match = np.full(slot_no, -1, dtype=np.int32)
+
+    for match in range(chromosome.shape[0]):
+        slot_match[chromosome[match]] = match
+
+    return slot_match
@@ -1,24 +1,200 @@
-from penalty_function import penalty
+from penalty_function import batch_penalty
+from instrumentation import count, emit
+from checkpoint import due, save
+from convergence import record
+from stopping import start_phase, spend
 import numpy as np
+from numba import njit, prange
+from collections import OrderedDict, namedtuple
+import itertools
+
+# bounded LRU cache of penalty points keyed by the bytes of a chromosome (its match→slot assignment)
+# counters holds the number of cache hits and misses
+FitnessCache = namedtuple("FitnessCache", ["entries", "capacity", "counters"])
+
+
+# create an empty fitness cache holding at most capacity chromosomes
+def fitness_cache(capacity=10000):
+    return FitnessCache(OrderedDict(), capacity, {"hits": 0, "misses": 0})
+
+
+# penalty points of a population, chromosomes found in the cache are not rescored
+def evaluate(population, instance, cache=None, stats=None):
+    if cache is None:
+        count(stats, "ga.evaluations", len(population))
+        return batch_penalty(population, instance)[0]
+
+    keys = [chromosome.tobytes() for chromosome in population]
+    penalty_points = np.empty(len(population), dtype=np.int64)
+    missing = []
+
+    for i, key in enumerate(keys):
+        if key in cache.entries:
+            cache.entries.move_to_end(key)
+            penalty_points[i] = cache.entries[key]
+            cache.counters["hits"] += 1
+        else:
+            missing.append(i)
+
+    count(stats, "ga.cache_hits", len(population) - len(missing))
+    count(stats, "ga.evaluations", len(missing))
+
+    if missing:
+        penalty_points[missing] = batch_penalty(population[missing], instance)[0]
+        cache.counters["misses"] += len(missing)
+
+        for i in missing:
+            cache.entries[keys[i]] = penalty_points[i]
+
+            if len(cache.entries) > cache.capacity:
+                cache.entries.popitem(last=False)
+
+    return penalty_points
 
 
 # generate initial population where all hard constraints have been solved except HC02
-def generate_chromosome(slot_match):
-    chromosome = np.copy(slot_match)
-    slot_no = chromosome.shape[0]
-    match_no = chromosome.shape[1]
+# each match gets a random slot among its available slots that are still empty; if a match is left without one,
+# placement restarts with the matches that have fewest available slots first (at most max_attempts times)
+def generate_chromosome(instance, max_attempts=100):
+    slot_no = instance.available.shape[0]
+    match_no = instance.available.shape[1]
+    order = np.arange(match_no)
+
+    for attempt in range(max_attempts):
+        chromosome = np.empty(match_no, dtype=np.int32)
+        slot_match = np.full(slot_no, -1, dtype=np.int32)
+
+        for match in order:
+            slots = instance.available_slots[instance.available_pointer[match]:instance.available_pointer[match + 1]]
+            free_slots = slots[slot_match[slots] == -1]
+
+            if len(free_slots) == 0:
+                break
+
+            random_slot = free_slots[np.random.randint(len(free_slots))]
+            chromosome[match] = random_slot
+            slot_match[random_slot] = match
+        else:
+            return chromosome
+
+        order = np.lexsort((np.random.random(match_no), np.diff(instance.available_pointer)))
+
+    raise RuntimeError(f"could not place all matches in available slots after {max_attempts} attempts")
+
+
+# constructive placement in the spirit of DSATUR graph colouring, matches sharing a referee must not be concurrent
+# the next match is the one with fewest empty available slots left that cause no clash (ties: most matches
+# sharing a referee, then noise), it gets the empty available slot with fewest clashes, preferring slots next to
+# (same day and venue) matches sharing a referee; noise (slot × match, in [0, 1)) breaks ties for diversity
+# like the saturation of DSATUR, the clash-free options of each match are kept up to date as slots fill and clashes
+# are added instead of being counted again at every step
+# returns -1 for matches that could not be placed
+@njit(cache=True)
+def greedy_placement(instance, noise):
+    slot_no = instance.available.shape[0]
+    match_no = instance.available.shape[1]
+    time_slot_no = instance.time_slot_no
+    chromosome = np.full(match_no, -1, dtype=np.int32)
+    slot_match = np.full(slot_no, -1, dtype=np.int32)
+    # number of placed matches sharing a referee with a match in each day and time slot
+    clashes = np.zeros((instance.day_no * time_slot_no, match_no), dtype=np.int32)
+    # number of empty available slots of a match in each day and time slot
+    free_slots = np.zeros((instance.day_no * time_slot_no, match_no), dtype=np.int32)
+    # number of empty available slots of a match that cause no clash
+    options = np.zeros(match_no, dtype=np.int32)
+    slot_group = instance.slot_day * time_slot_no + instance.slot_time
 
     for match in range(match_no):
-        while True:
-            random_slot = np.random.randint(slot_no)
-            # if the slot is available and empty
-            if chromosome[random_slot][match] == 0 and np.count_nonzero(chromosome[random_slot] == 1) == 0:
-                chromosome[random_slot][match] = 1
-                break
+        for slot in instance.available_slots[instance.available_pointer[match]:instance.available_pointer[match + 1]]:
+            free_slots[slot_group[slot], match] += 1
+            options[match] += 1
+
+    for step in range(match_no):
+        # select the most constrained match that has not been placed
+        next_match = -1
+        next_degree = 0
+
+        for match in range(match_no):
+            if chromosome[match] != -1:
+                continue
+
+            degree = instance.conflict_pointer[match + 1] - instance.conflict_pointer[match]
+
+            if next_match == -1 or options[match] < options[next_match] or (options[match] == options[next_match] and (
+                    degree > next_degree or (degree == next_degree and noise[0, match] > noise[0, next_match]))):
+                next_match = match
+                next_degree = degree
+
+        # place it in the cheapest empty available slot
+        best_slot = -1
+        best_cost = 0.0
+
+        for slot in instance.available_slots[instance.available_pointer[next_match]:
+                                             instance.available_pointer[next_match + 1]]:
+            if slot_match[slot] != -1:
+                continue
+
+            cost = 1000.0 * clashes[slot_group[slot], next_match] + noise[slot, next_match]
+
+            for adjacent_slot in (slot - 1, slot + 1):
+                if 0 <= adjacent_slot < slot_no and instance.slot_day[adjacent_slot] == instance.slot_day[slot] and \
+                        instance.slot_venue[adjacent_slot] == instance.slot_venue[slot] and \
+                        slot_match[adjacent_slot] != -1 and \
+                        instance.match_match[next_match][slot_match[adjacent_slot]] == 1:
+                    cost -= 1.0
+
+            if best_slot == -1 or cost < best_cost:
+                best_slot = slot
+                best_cost = cost
+
+        if best_slot == -1:
+            return chromosome
+
+        chromosome[next_match] = best_slot
+        slot_match[best_slot] = next_match
+        group = slot_group[best_slot]
+
+        # the slot is no longer an option of the matches available in it
+        for match in range(match_no):
+            if instance.available[best_slot, match]:
+                free_slots[group, match] -= 1
+
+                if clashes[group, match] == 0:
+                    options[match] -= 1
+
+        # the first clash in the day and time slot takes all its empty slots from the options of a match
+        for match in instance.conflict_matches[instance.conflict_pointer[next_match]:
+                                               instance.conflict_pointer[next_match + 1]]:
+            if clashes[group, match] == 0:
+                options[match] -= free_slots[group, match]
+
+            clashes[group, match] += 1
+
+    return chromosome
+
+
+# generate a chromosome by greedy placement, falls back to random placement if greedy placement gets stuck
+def construct_chromosome(instance):
+    chromosome = greedy_placement(instance, np.random.random(instance.available.shape))
+
+    if (chromosome == -1).any():
+        return generate_chromosome(instance)
 
     return chromosome
 
 
+# create an initial population sorted by penalty points
+# seeding is "random" (random placement) or "greedy" (constructive placement avoiding HC02 clashes)
+def initial_population(population_size, instance, seeding="random", cache=None, stats=None):
+    generate = construct_chromosome if seeding == "greedy" else generate_chromosome
+    population = np.stack([generate(instance) for _ in range(population_size)])
+
+    # score all chromosomes in one batch
+    penalty_points = evaluate(population, instance, cache, stats)
+    order = penalty_points.argsort()
+    return population[order], penalty_points[order]
+
+
 # select 2 chromosomes based on tournament selection
 def selection(population, penalty_points):
     tournament_size = 2
@@ -40,70 +216,100 @@ def selection(population, penalty_points):
 
 
 # perform 2-point crossover
-def crossover(first_parent, second_parent):
+def crossover(first_parent, second_parent, instance, stats=None):
     first_child = np.copy(first_parent)
     second_child = np.copy(second_parent)
-    match_no = first_parent.shape[1]
+    match_no = first_parent.shape[0]
     cutpoint1, cutpoint2 = np.random.choice(range(match_no), 2)
 
     if cutpoint1 > cutpoint2:
         cutpoint1, cutpoint2 = cutpoint2, cutpoint1
 
     # swap matches from cutpoint1 to cutpoint2 between 2 parents
-    first_child[:, cutpoint1:cutpoint2], second_child[:, cutpoint1:cutpoint2] = \
-        second_child[:, cutpoint1:cutpoint2], np.copy(first_child[:, cutpoint1:cutpoint2])
-    first_child = repair(first_child, cutpoint1, cutpoint2)
-    second_child = repair(second_child, cutpoint1, cutpoint2)
+    first_child[cutpoint1:cutpoint2], second_child[cutpoint1:cutpoint2] = \
+        second_child[cutpoint1:cutpoint2], np.copy(first_child[cutpoint1:cutpoint2])
+    first_child = repair(first_child, cutpoint1, cutpoint2, instance)
+    second_child = repair(second_child, cutpoint1, cutpoint2, instance)
+
+    count(stats, "ga.repairs", 2)
+    count(stats, "ga.repair_failures", (first_child is None) + (second_child is None))
+
+    # a child that cannot be repaired is replaced by a copy of its parent
+    if first_child is None:
+        first_child = np.copy(first_parent)
+
+    if second_child is None:
+        second_child = np.copy(second_parent)
+
     return first_child, second_child
 
 
-# repair chromosome after crossover
-def repair(chromosome, cutpoint1, cutpoint2):
-    slot_no = chromosome.shape[0]
+# repair chromosome after crossover, returns None if a match has no empty available slot left
+def repair(chromosome, cutpoint1, cutpoint2, instance):
+    slot_no = instance.available.shape[0]
+    slot_count = np.bincount(chromosome, minlength=slot_no)  # number of matches scheduled for each slot
 
     for match in range(cutpoint1, cutpoint2):
-        slot = np.where(chromosome[:, match] == 1)[0][0]
+        slot = chromosome[match]
 
         # more than 1 match scheduled for a slot
-        if np.count_nonzero(chromosome[slot] == 1) > 1:
-            chromosome[slot][match] = 0
+        if slot_count[slot] > 1:
+            slots = instance.available_slots[instance.available_pointer[match]:instance.available_pointer[match + 1]]
+            free_slots = slots[slot_count[slots] == 0]
 
-            # schedule match for another random slot
-            while True:
-                random_slot = np.random.randint(slot_no)
+            if len(free_slots) == 0:
+                return None
 
-                if chromosome[random_slot][match] == 0 and np.count_nonzero(chromosome[random_slot] == 1) == 0:
-                    chromosome[random_slot][match] = 1
-                    break
+            # schedule match for another random slot
+            random_slot = free_slots[np.random.randint(len(free_slots))]
+            slot_count[slot] -= 1
+            chromosome[match] = random_slot
+            slot_count[random_slot] += 1
 
     return chromosome
 
 
 # swap mutation of chromosome after crossover
-def mutation(chromosome):
-    match_no = chromosome.shape[1]
+def mutation(chromosome, instance):
+    available = instance.available
+    match_no = chromosome.shape[0]
     random_match1 = np.random.randint(match_no)
-    slot1 = np.where(chromosome[:, random_match1] == 1)[0][0]
+    slot1 = chromosome[random_match1]
 
-    while True:
-        random_match2 = np.random.randint(match_no)
-        slot2 = np.where(chromosome[:, random_match2] == 1)[0][0]
+    # matches that can be scheduled on the slot of the random match and vice versa,
+    # the chromosome is left unchanged if there is none
+    swappable_matches = np.flatnonzero(available[slot1] & available[chromosome, random_match1])
+    swappable_matches = swappable_matches[swappable_matches != random_match1]
 
-        # 2 matches can be scheduled on slots to be exchanged, hence swap 2 matches
-        if chromosome[slot1][random_match2] == 0 and chromosome[slot2][random_match1] == 0:
-            chromosome[slot1][random_match1] = chromosome[slot2][random_match2] = 0
-            chromosome[slot1][random_match2] = chromosome[slot2][random_match1] = 1
-            break
+    if len(swappable_matches) > 0:
+        random_match2 = swappable_matches[np.random.randint(len(swappable_matches))]
+        slot2 = chromosome[random_match2]
+        chromosome[random_match1], chromosome[random_match2] = slot2, slot1
 
     return chromosome
 
 
 # Steady-State Genetic Algorithm - replace 2 chromosomes in population
-def replacement(population, penalty_points, first_child, second_child, first_penalty_point, second_penalty_point):
+# with reject_duplicates, a child identical to a chromosome in the population (or to the other child) is discarded
+def replacement(population, penalty_points, first_child, second_child, first_penalty_point, second_penalty_point,
+                reject_duplicates=False):
     # replace 2 chromosomes of highest penalty points with 2 new chromosomes
     population_size = len(population)
-    population[population_size - 1], population[population_size - 2] = first_child, second_child
-    penalty_points[population_size - 1], penalty_points[population_size - 2] = first_penalty_point, second_penalty_point
+    children = [(first_child, first_penalty_point), (second_child, second_penalty_point)]
+
+    if reject_duplicates:
+        accepted = []
+
+        for child, penalty_point in children:
+            if not (population == child).all(axis=1).any() and \
+                    not any((child == accepted_child).all() for accepted_child, _ in accepted):
+                accepted.append((child, penalty_point))
+
+        children = accepted
+
+    for i, (child, penalty_point) in enumerate(children):
+        population[population_size - 1 - i] = child
+        penalty_points[population_size - 1 - i] = penalty_point
 
     # sort population based on penalty points
     population = population[penalty_points.argsort()]
@@ -112,26 +318,203 @@ def replacement(population, penalty_points, first_child, second_child, first_pen
     return population, penalty_points
 
 
-# reproduce new chromosomes in new generation
-def reproduction(max_generations, population, penalty_points, match_match,
-                 match_referee, referee_preference):
-    plot_data = []
+# generations of a run from first_generation to max_generations, unbounded if max_generations is None
+def generation_range(first_generation, max_generations):
+    return itertools.count(first_generation) if max_generations is None else range(first_generation, max_generations)
+
+
+# pass the best penalty points in plot_data to recorder (see convergence.py) once there are chunk_size of them or
+# if flush is set, so the trace of a run does not grow with its generations; without a recorder they are kept
+def record_generations(recorder, plot_data, flush=False, chunk_size=1000):
+    if recorder is not None and (flush or len(plot_data) >= chunk_size):
+        record(recorder, plot_data)
+        plot_data.clear()
+
 
-    for generation in range(max_generations):
+# reproduce new chromosomes in new generation
+# children are scored through cache if one is given, see replacement for reject_duplicates
+# the best penalty point of every generation is emitted to stats
+# plot data holds the best penalty point after each generation, unless the trace is passed to recorder instead
+# the population is saved to checkpoint (see checkpoint.py) when it is due, a run is resumed from a checkpoint by
+# passing its population, penalty points, generation (first_generation) and plot data (and recorder)
+# the run ends early when budget (see stopping.py) says so, max_generations may then be None
+def reproduction(max_generations, population, penalty_points, instance, verbose=True, cache=None,
+                 reject_duplicates=False, stats=None, checkpoint=None, first_generation=0, plot_data=None,
+                 budget=None, recorder=None):
+    plot_data = [] if plot_data is None else list(plot_data)
+
+    if first_generation == 0:
+        start_phase(budget)  # a resumed phase keeps the stagnation of its checkpoint
+
+    for generation in generation_range(first_generation, max_generations):
         first_parent, second_parent = selection(population, penalty_points)
-        first_child, second_child = crossover(first_parent, second_parent)
-        first_child = mutation(first_child)
-        second_child = mutation(second_child)
-        first_penalty_point = \
-            penalty(first_child, match_match, match_referee, referee_preference)[0]
-        second_penalty_point = \
-            penalty(second_child, match_match, match_referee, referee_preference)[0]
+        first_child, second_child = crossover(first_parent, second_parent, instance, stats)
+        first_child = mutation(first_child, instance)
+        second_child = mutation(second_child, instance)
+        first_penalty_point, second_penalty_point = \
+            evaluate(np.stack((first_child, second_child)), instance, cache, stats)
         population, penalty_points = \
             replacement(population, penalty_points, first_child, second_child,
-                        first_penalty_point, second_penalty_point)
+                        first_penalty_point, second_penalty_point, reject_duplicates)
+        plot_data.append(penalty_points[0])
+        record_generations(recorder, plot_data)
+        emit(stats, "ga", generation=generation + 1, best_penalty_point=int(penalty_points[0]))
+
+        if verbose and (generation + 1) % 5 == 0:
+            print("[Iteration ", generation + 1, "] Penalty Point: ", penalty_points[0], sep="")
+
+        if spend(budget, 2, penalty_points[0]):
+            break
+
+        if due(checkpoint):
+            record_generations(recorder, plot_data, flush=True)
+            save(checkpoint, "ga", recorder, budget, generation=generation + 1, population=population,
+                 penalty_points=penalty_points, plot_data=plot_data)
+
+    record_generations(recorder, plot_data, flush=True)
+    return population, penalty_points, plot_data
+
+
+# repair children after crossover, the matches between the cutpoints of each child that share a slot with another
+# match are moved to an empty available slot chosen by random_numbers (child × match, in [0, 1))
+# a child that cannot be repaired is replaced by its parent, returns the number of such children
+@njit(cache=True, parallel=True)
+def repair_population(children, parents, cutpoints, instance, random_numbers):
+    slot_no = instance.available.shape[0]
+    failures = 0
+
+    for i in prange(children.shape[0]):
+        child = children[i]
+        slot_count = np.zeros(slot_no, dtype=np.int32)  # number of matches scheduled for each slot
+
+        for match in range(child.shape[0]):
+            slot_count[child[match]] += 1
+
+        for match in range(cutpoints[i, 0], cutpoints[i, 1]):
+            slot = child[match]
+
+            # more than 1 match scheduled for a slot
+            if slot_count[slot] > 1:
+                slots = instance.available_slots[instance.available_pointer[match]:
+                                                 instance.available_pointer[match + 1]]
+                free_slot_no = 0
+
+                for available_slot in slots:
+                    if slot_count[available_slot] == 0:
+                        free_slot_no += 1
+
+                if free_slot_no == 0:
+                    child[:] = parents[i]
+                    failures += 1
+                    break
+
+                chosen = int(random_numbers[i, match] * free_slot_no)
+
+                for available_slot in slots:
+                    if slot_count[available_slot] == 0:
+                        if chosen == 0:
+                            slot_count[slot] -= 1
+                            child[match] = available_slot
+                            slot_count[available_slot] += 1
+                            break
+
+                        chosen -= 1
+
+    return failures
+
+
+# swap mutation of each child, the first match and its swap partner are chosen by random_numbers (child × 2)
+# among the matches that can exchange slots with it; a child without such a match is left unchanged
+@njit(cache=True, parallel=True)
+def mutate_population(children, instance, random_numbers):
+    available = instance.available
+    match_no = children.shape[1]
+
+    for i in prange(children.shape[0]):
+        child = children[i]
+        match1 = int(random_numbers[i, 0] * match_no)
+        slot1 = child[match1]
+        swappable_match_no = 0
+
+        for match2 in range(match_no):
+            if match2 != match1 and available[slot1][match2] and available[child[match2]][match1]:
+                swappable_match_no += 1
+
+        chosen = int(random_numbers[i, 1] * swappable_match_no)
+
+        for match2 in range(match_no):
+            if match2 != match1 and available[slot1][match2] and available[child[match2]][match1]:
+                if chosen == 0:
+                    child[match1], child[match2] = child[match2], slot1
+                    break
+
+                chosen -= 1
+
+
+# Generational Genetic Algorithm - every generation creates offspring_no children (population size by default)
+# with binary tournament selection, 2-point crossover, repair and swap mutation over the whole population at
+# once, the best chromosomes of parents and children survive (with reject_duplicates, copies of another
+# chromosome rank behind all distinct chromosomes)
+# checkpoints, budget and recorder are used as in reproduction
+def generational_reproduction(max_generations, population, penalty_points, instance, verbose=True, cache=None,
+                              reject_duplicates=False, offspring_no=None, stats=None, checkpoint=None,
+                              first_generation=0, plot_data=None, budget=None, recorder=None):
+    population_size, match_no = population.shape
+    pair_no = ((offspring_no or population_size) + 1) // 2
+    plot_data = [] if plot_data is None else list(plot_data)
+
+    if first_generation == 0:
+        start_phase(budget)  # a resumed phase keeps the stagnation of its checkpoint
+
+    for generation in generation_range(first_generation, max_generations):
+        # tournament selection of pair_no pairs of parents
+        tournaments = np.random.randint(population_size, size=(2, pair_no, 2))
+        winners = np.where(penalty_points[tournaments[..., 0]] <= penalty_points[tournaments[..., 1]],
+                           tournaments[..., 0], tournaments[..., 1])
+        parents = population[winners.reshape(-1)]
+
+        # 2-point crossover, children of a pair exchange the matches between its cutpoints
+        cutpoints = np.sort(np.random.randint(match_no, size=(pair_no, 2)), axis=1)
+        exchanged = (np.arange(match_no) >= cutpoints[:, :1]) & (np.arange(match_no) < cutpoints[:, 1:])
+        first_parents, second_parents = parents[:pair_no], parents[pair_no:]
+        children = np.concatenate([np.where(exchanged, second_parents, first_parents),
+                                   np.where(exchanged, first_parents, second_parents)])
+        failures = repair_population(children, parents, np.concatenate([cutpoints, cutpoints]), instance,
+                                     np.random.random(children.shape))
+        count(stats, "ga.repairs", len(children))
+        count(stats, "ga.repair_failures", failures)
+        mutate_population(children, instance, np.random.random((len(children), 2)))
+        children_penalty_points = evaluate(children, instance, cache, stats)
+
+        # survivor selection over parents and children with a partial sort
+        candidates = np.concatenate([population, children])
+        candidate_penalty_points = np.concatenate([penalty_points, children_penalty_points])
+        ranking = candidate_penalty_points.astype(np.float64)
+
+        # repeated chromosomes only survive if there are not enough distinct ones
+        if reject_duplicates:
+            _, unique = np.unique(candidates, axis=0, return_index=True)
+            duplicate = np.ones(len(candidates), dtype=bool)
+            duplicate[unique] = False
+            ranking[duplicate] = np.inf
+
+        survivors = np.argpartition(ranking, population_size - 1)[:population_size]
+        survivors = survivors[ranking[survivors].argsort(kind="stable")]
+        population, penalty_points = candidates[survivors], candidate_penalty_points[survivors]
         plot_data.append(penalty_points[0])
+        record_generations(recorder, plot_data)
+        emit(stats, "ga", generation=generation + 1, best_penalty_point=int(penalty_points[0]))
 
-        if (generation + 1) % 5 == 0:
+        if verbose and (generation + 1) % 5 == 0:
             print("[Iteration ", generation + 1, "] Penalty Point: ", penalty_points[0], sep="")
 
+        if spend(budget, len(children), penalty_points[0]):
+            break
+
+        if due(checkpoint):
+            record_generations(recorder, plot_data, flush=True)
+            save(checkpoint, "ga", recorder, budget, generation=generation + 1, population=population,
+                 penalty_points=penalty_points, plot_data=plot_data)
+
+    record_generations(recorder, plot_data, flush=True)
     return population, penalty_points, plot_data
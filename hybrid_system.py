@@ -1,56 +1,271 @@
 import data as dt
-from penalty_function import penalty
+from penalty_function import penalty, referee_statistics, delta_penalty, workspace
+from encoding import slot_index
 import genetic_algorithm as ga
 import simulated_annealing as sa
+import island_model as im
+import parallel_annealing as pa
+from instrumentation import create_stats, count_operators, timed, emit, summary
+import convergence as cv
+import report
+from checkpoint import create_checkpoint, load
+from stopping import create_budget, spend, resume_budget
 import numpy as np
+import os
 from timeit import default_timer as timer
 
+# options of solve(), any option left out of the config keeps its default
+# island_no > 1 evolves that many populations in parallel processes (island model) before annealing
+# seeding of the initial population is "random" or "greedy" (see genetic_algorithm.initial_population)
+# cache_capacity > 0 memoizes GA penalty points of that many chromosomes, reject_duplicates keeps children
+# identical to a chromosome in the population out of it
+# ga_mode "generational" breeds offspring_no children (population size by default) per generation in batch
+# instead of 2 (steady-state)
+# stats_stream (an open text file or a path to append to) receives progress events as json lines,
+# verbose prints progress to the console
+# the convergence trace keeps the last trace_capacity samples of every trace_every-th iteration or, with
+# trace_change_points, of the iterations where the best penalty point changes; it is also written to trace_path
+# (see convergence.read_samples) if set
+# checkpoint_path receives the state of the run at most every checkpoint_interval seconds, with resume a run
+# continues from the checkpoint if it exists (checkpoints need island_no 1 and single annealing)
+# the run stops with the best schedule found so far after time_budget seconds, after evaluation_budget penalty
+# evaluations or once the best penalty point is at most target_penalty, the GA or SA phase ends after stagnation
+# evaluations without improvement (see stopping.py, these need island_no 1 and single annealing), with any of
+# them ga_max_generations may be None to evolve until the GA is stopped
+# annealing is "single", "multi-start" (chain_no best chromosomes) or "tempering" (chain_no temperatures)
+DEFAULT_CONFIG = {"population_size": 10,
+                  "ga_max_generations": 100,
+                  "island_no": 1,
+                  "migration_interval": 10,
+                  "migration_size": 1,
+                  "annealing": "single",
+                  "chain_no": 4,
+                  "seeding": "random",
+                  "cache_capacity": 0,
+                  "reject_duplicates": False,
+                  "ga_mode": "steady-state",
+                  "offspring_no": None,
+                  "seed": None,
+                  "verbose": False,
+                  "stats_stream": None,
+                  "trace_capacity": 65536,
+                  "trace_every": 1,
+                  "trace_change_points": True,
+                  "trace_path": None,
+                  "checkpoint_path": None,
+                  "checkpoint_interval": 60,
+                  "resume": False,
+                  "time_budget": None,
+                  "evaluation_budget": None,
+                  "target_penalty": None,
+                  "stagnation": None}
 
-# hybrid system using genetic algorithm and simulated annealing
-def hybrid_system():
-    # load data and functions
-    slot_match, match_match, match_referee, referee_preference = dt.load()
-
-    # initialize matrices
-    slot_no = slot_match.shape[0]
-    match_no = slot_match.shape[1]
-    population_size = 10
-    population = np.empty([population_size, slot_no, match_no], dtype=np.int8)
-    penalty_points = np.empty(population_size, dtype=int)
-
-    # create initial population
-    for i in range(population_size):
-        chromosome = ga.generate_chromosome(slot_match)
-        population[i] = chromosome
-        penalty_point = \
-            penalty(chromosome, match_match, match_referee, referee_preference)[0]
-        penalty_points[i] = penalty_point
-
-    # sort initial population based on penalty points
-    population = population[penalty_points.argsort()]
-    penalty_points = penalty_points[penalty_points.argsort()]
-
-    # run genetic algorithm for 100 generations
-    ga_max_generations = 100
-    population, penalty_points, ga_plot_data = \
-        ga.reproduction(ga_max_generations, population, penalty_points, match_match,
-                        match_referee, referee_preference)
-
-    # run simulated annealing after running genetic algorithm
-    temperature = penalty_points[population_size - 1] - penalty_points[0]
+
+# solve a problem instance with the hybrid system, nothing is read or written apart from the stats stream
+# returns the best chromosome with its penalty, constraint counts, referee statistics, operator statistics of the
+# neighbourhood structures (see simulated_annealing.markov_chain), fitness cache hits and misses, instrumentation
+# counters and phase timers (see instrumentation.summary), the stopping criterion that ended the run (None if the
+# schedules ran to the end) and the convergence trace (sampled iterations and best penalty points)
+def solve(instance, config=None):
+    config = dict(DEFAULT_CONFIG, **(config or {}))
+    seed = config["seed"]
+    verbose = config["verbose"]
+    stream = config["stats_stream"]
+
+    if isinstance(stream, str):
+        with open(stream, 'a') as file:
+            return solve(instance, dict(config, stats_stream=file))
+
+    # each chromosome is a match→slot array
+    slot_no = instance.available.shape[0]
+    population_size = config["population_size"]
+    ga_max_generations = config["ga_max_generations"]
+    checkpoint_path = config["checkpoint_path"]
+    stats = create_stats(stream)
+    cache = ga.fitness_cache(config["cache_capacity"]) if config["cache_capacity"] else None
+
+    criteria = [config["time_budget"], config["evaluation_budget"], config["target_penalty"], config["stagnation"]]
+    budget = create_budget(*criteria) if any(criterion is not None for criterion in criteria) else None
+
+    if (checkpoint_path is not None or budget is not None) and \
+            (config["island_no"] > 1 or config["annealing"] != "single"):
+        raise ValueError("checkpoints and stopping criteria need island_no 1 and single annealing")
+
+    if ga_max_generations is None and budget is None:
+        raise ValueError("ga_max_generations can only be None with a stopping criterion")
+
+    if seed is not None:
+        np.random.seed(seed)
+        sa.seed(seed)
+
+    # worker processes are seeded from seed, unseeded runs draw it so repeated runs differ
+    worker_seed = seed if seed is not None else int(np.random.randint(2 ** 31))
+
+    # resuming also restores numpy's random generator and the budget spent before the checkpoint
+    checkpoint = create_checkpoint(checkpoint_path, config["checkpoint_interval"]) if checkpoint_path else None
+    state = load(checkpoint_path) if config["resume"] and checkpoint and os.path.exists(checkpoint_path) else None
+    phase = state["phase"] if state is not None else None
+
+    if state is not None:
+        resume_budget(budget, state)
+
+    if state is not None and "trace_state" in state:
+        recorder = cv.restore(state, config["trace_every"], config["trace_change_points"], config["trace_path"])
+    else:
+        recorder = cv.create_recorder(config["trace_capacity"], config["trace_every"],
+                                      config["trace_change_points"], config["trace_path"])
+
+    if config["island_no"] > 1:
+        # run island-model genetic algorithm, islands are merged into one population
+        with timed(stats, "ga"):
+            population, penalty_points, ga_plot_data = \
+                im.island_reproduction(ga_max_generations, config["island_no"], population_size, instance,
+                                       config["migration_interval"], config["migration_size"],
+                                       worker_seed, verbose=verbose, seeding=config["seeding"],
+                                       cache=cache, reject_duplicates=config["reject_duplicates"],
+                                       ga_mode=config["ga_mode"], offspring_no=config["offspring_no"], stats=stats)
+            cv.record(recorder, ga_plot_data)
+    elif phase != "sa":
+        first_generation = 0
+        ga_plot_data = None
+
+        if phase == "ga":
+            population, penalty_points = state["population"], state["penalty_points"]
+            first_generation, ga_plot_data = int(state["generation"]), state["plot_data"]
+        else:
+            # create initial population sorted by penalty points
+            with timed(stats, "initial_population"):
+                population, penalty_points = \
+                    ga.initial_population(population_size, instance, config["seeding"], cache, stats)
+
+            spend(budget, population_size, penalty_points[0])
+
+        # run genetic algorithm
+        with timed(stats, "ga"):
+            if config["ga_mode"] == "generational":
+                population, penalty_points, ga_plot_data = \
+                    ga.generational_reproduction(ga_max_generations, population, penalty_points, instance, verbose,
+                                                 cache, config["reject_duplicates"], config["offspring_no"], stats,
+                                                 checkpoint, first_generation, ga_plot_data, budget, recorder)
+            else:
+                population, penalty_points, ga_plot_data = \
+                    ga.reproduction(ga_max_generations, population, penalty_points, instance, verbose, cache,
+                                    config["reject_duplicates"], stats, checkpoint, first_generation, ga_plot_data,
+                                    budget, recorder)
+
+    if phase == "sa":
+        # the annealing state of the checkpoint replaces the starting point (see simulated_annealing.markov_chain)
+        temperature, candidate, penalty_point = \
+            state["temperature"], state["current_candidate"], state["current_penalty"][0]
+    else:
+        # run simulated annealing after running genetic algorithm
+        temperature = penalty_points[-1] - penalty_points[0]
+        candidate = population[0]
+        penalty_point = penalty_points[0]
+
+        # a population of equal penalty points has no spread to start annealing from
+        if temperature <= 0:
+            temperature = sa.sample_temperature(candidate, instance)
+
+    with timed(stats, "sa"):
+        if config["annealing"] == "multi-start":
+            best_candidate, best_penalty_point, sa_plot_data, operator_statistics = \
+                pa.multi_start_anneal(config["chain_no"], temperature, population, penalty_points, instance,
+                                      seed=worker_seed, recorder=recorder)
+        elif config["annealing"] == "tempering":
+            best_candidate, best_penalty_point, sa_plot_data, operator_statistics = \
+                pa.parallel_tempering(config["chain_no"], temperature, population, penalty_points, instance,
+                                      seed=worker_seed, recorder=recorder)
+        else:
+            best_candidate, best_penalty_point, sa_plot_data, operator_statistics = \
+                sa.anneal(temperature, candidate, penalty_point, instance, verbose=verbose, stats=stats,
+                          recorder=recorder, checkpoint=checkpoint, state=state if phase == "sa" else None,
+                          budget=budget)
+
+    cv.record(recorder, sa_plot_data)
+    cv.close(recorder)
+    plot_iterations, plot_data = cv.samples(recorder)
+    count_operators(stats, operator_statistics)
+
+    with timed(stats, "statistics"):
+        constraint_counts = penalty(best_candidate, slot_index(best_candidate, slot_no), instance)
+        statistics = referee_statistics(best_candidate, instance)
+
+    stop_reason = budget.state["reason"] if budget is not None else None
+    emit(stats, "done", penalty_point=int(constraint_counts[0]), stop_reason=stop_reason)
+
+    return {"candidate": best_candidate,
+            "penalty_point": best_penalty_point,
+            "constraint_counts": constraint_counts,
+            "referee_statistics": statistics,
+            "operator_statistics": operator_statistics,
+            "cache_statistics": dict(cache.counters) if cache else None,
+            "stats": summary(stats),
+            "stop_reason": stop_reason,
+            "plot_iterations": plot_iterations,
+            "plot_data": plot_data}
+
+
+# compile every numba kernel on a tiny in-memory instance, so a long-running worker pays the JIT
+# (or cache loading) cost once at startup instead of on its first scheduling request
+def warm_up():
+    geometry = dt.DEFAULT_GEOMETRY
+    slot_no = len(geometry.days) * len(geometry.venues) * len(geometry.time_slots)
+    match_referee = np.zeros([4, 4], dtype=np.int8)
+
+    for match in range(4):
+        match_referee[match, [match, (match + 1) % 4, (match + 2) % 4]] = 1
+
+    instance = dt.create_instance(geometry, match_referee, np.zeros([4, slot_no], dtype=np.int8),
+                                  np.zeros(slot_no, dtype=bool), np.full([4, 3], 2, dtype=np.int8))
+    population, penalty_points = ga.initial_population(2, instance, "greedy")
+    ga.generational_reproduction(1, np.copy(population), np.copy(penalty_points), instance, False)
     candidate = population[0]
-    penalty_point = penalty_points[0]
-    best_candidate, best_penalty_point, sa_plot_data = \
-        sa.anneal(temperature, candidate, penalty_point, match_match,
-                  match_referee, referee_preference)
+    slot_match = slot_index(candidate, slot_no)
+    penalty(candidate, slot_match, instance)
+    referee_statistics(candidate, instance)
+    new_candidate = np.copy(candidate)
+    new_slot_match = np.copy(slot_match)
+
+    for neighbourhood_structure in [sa.neighbourhood_structure1, sa.neighbourhood_structure2,
+                                    sa.neighbourhood_structure3, sa.neighbourhood_structure4]:
+        match1, _, match2, _, _ = neighbourhood_structure(new_candidate, new_slot_match, instance)
+        delta_penalty(candidate, slot_match, new_candidate, new_slot_match, match1, match2,
+                      instance, workspace(instance))
+
+    sa.markov_chain(1, 0, 1, 10, candidate, penalty_points[0], instance, verbose=False)
+
+
+# hybrid system using genetic algorithm and simulated annealing
+# reads the tournament from input_files (or a bundle, see data.save_bundle) and writes the schedule, graph,
+# result csv and json result named with a new run id to the current directory
+# with a reporter (see report.create_reporter) the graph and schedule report are rendered from the json result on
+# the reporter's process instead, so this returns as soon as the result files are written
+def hybrid_system(config=None, directory="input_files", show=False, reporter=None):
+    geometry, instance = dt.load_tournament(directory)
+    config = dict({"verbose": True}, **(config or {}))
+    result = solve(instance, config)
+
+    if reporter is None:
+        result["run_id"] = dt.write(result["candidate"], instance, geometry, result["referee_statistics"],
+                                    result["constraint_counts"], result["plot_data"], show, config["verbose"],
+                                    result["plot_iterations"])
+        dt.write_result(result, instance, geometry, result["run_id"])
+    else:
+        result["run_id"] = dt.write_schedule(result["candidate"], instance)
+        report.submit(reporter, dt.write_result(result, instance, geometry, result["run_id"]), config["verbose"])
+
+    return result
+
 
-    # write result data
-    constraint_counts = \
-        penalty(best_candidate, match_match, match_referee, referee_preference)
-    plot_data = np.concatenate([ga_plot_data, sa_plot_data])
-    dt.write(best_candidate,referee_preference, constraint_counts, plot_data)
+# continue a hybrid_system run from its checkpoint, config must name the checkpoint_path and options of the run
+# (the run starts from scratch if there is no checkpoint yet)
+def resume(config, directory="input_files", show=False):
+    return hybrid_system(dict(config, resume=True), directory, show)
 
 
-start = timer()
-hybrid_system()
-print("\nExecution Time of Hybrid System:", round(timer() - start, 2), "seconds")
\ No newline at end of file
+# guarded so importing the module (e.g. by worker processes of the island model) does no work
+if __name__ == "__main__":
+    start = timer()
+    hybrid_system(show=True)
+    print("\nExecution Time of Hybrid System:", round(timer() - start, 2), "seconds")
@@ -0,0 +1,63 @@
+import json
+from collections import namedtuple, defaultdict
+from contextlib import contextmanager
+from timeit import default_timer as timer
+
+# counters and accumulated wall time (seconds) of named phases of a run
+# events are written as json lines to stream (an open text file) while the run progresses, if it is set
+# every function accepts None instead of stats, so uninstrumented runs pay nothing
+Stats = namedtuple("Stats", ["counters", "timers", "stream", "start"])
+
+# columns of the operator statistics returned by simulated annealing
+OPERATOR_COLUMNS = ["selected", "accepted", "improving", "points_gained", "no_move", "attempts"]
+
+
+# create empty stats, the clock of the events starts now
+def create_stats(stream=None):
+    return Stats(defaultdict(int), defaultdict(float), stream, timer())
+
+
+# add value to a counter
+def count(stats, name, value=1):
+    if stats is not None:
+        stats.counters[name] += int(value)
+
+
+# add counters of another run (e.g. of a worker process) to stats
+def merge(stats, counters):
+    for name, value in counters.items():
+        count(stats, name, value)
+
+
+# add the operator statistics of simulated annealing, one counter per neighbourhood structure and column
+def count_operators(stats, operator_statistics):
+    for operator, row in enumerate(operator_statistics):
+        for column, value in zip(OPERATOR_COLUMNS, row):
+            count(stats, f"sa.neighbourhood_structure{operator + 1}.{column}", value)
+
+
+# measure the wall time of a block, e.g. with timed(stats, "ga"): ...
+@contextmanager
+def timed(stats, name):
+    start = timer()
+
+    try:
+        yield
+    finally:
+        if stats is not None:
+            stats.timers[name] += timer() - start
+
+
+# write an event with the seconds since the start of the run as a json line
+def emit(stats, event, **fields):
+    if stats is not None and stats.stream is not None:
+        fields = dict(event=event, seconds=round(timer() - stats.start, 6), **fields)
+        stats.stream.write(json.dumps(fields, default=lambda value: value.tolist()) + "\n")
+        stats.stream.flush()
+
+
+# plain dictionary of the counters and timers of a run
+def summary(stats):
+    return {"counters": dict(stats.counters),
+            "timers": dict(stats.timers),
+            "seconds": timer() - stats.start}
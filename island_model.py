@@ -0,0 +1,100 @@
+import genetic_algorithm as ga
+from instrumentation import create_stats, merge, emit
+import numpy as np
+from multiprocessing import get_context
+
+# read-only problem data of each worker process, set once by the pool initializer instead of pickled per task
+problem = {}
+
+
+# store problem data in a worker process
+def initialize_worker(instance):
+    problem["instance"] = instance
+
+
+# evolve one island for a number of generations, creating its initial population on the first epoch
+# options are the keyword arguments of island_reproduction that control the genetic algorithm
+# with a cache capacity, each worker process keeps its own fitness cache across tasks and returns the number of
+# cache hits and misses of the task, followed by the instrumentation counters of the task
+def evolve_island(island):
+    population, penalty_points, population_size, generations, seed, options = island
+    instance = problem["instance"]
+    np.random.seed(seed)  # deterministic per island and epoch
+    cache_capacity = options["cache_capacity"]
+    cache = problem.setdefault("cache", ga.fitness_cache(cache_capacity)) if cache_capacity else None
+    counters = dict(cache.counters) if cache else {"hits": 0, "misses": 0}
+    stats = create_stats()
+
+    if population is None:
+        population, penalty_points = \
+            ga.initial_population(population_size, instance, options["seeding"], cache, stats)
+
+    if options["ga_mode"] == "generational":
+        population, penalty_points, plot_data = \
+            ga.generational_reproduction(generations, population, penalty_points, instance, options["verbose"],
+                                         cache, options["reject_duplicates"], options["offspring_no"], stats)
+    else:
+        population, penalty_points, plot_data = \
+            ga.reproduction(generations, population, penalty_points, instance, options["verbose"], cache,
+                            options["reject_duplicates"], stats)
+    counters = {key: cache.counters[key] - value for key, value in counters.items()} if cache else counters
+    return population, penalty_points, plot_data, counters, dict(stats.counters)
+
+
+# copy the best chromosomes of each island over the worst chromosomes of the next island (ring topology)
+def migrate(islands, migration_size):
+    island_no = len(islands)
+    elites = [(population[:migration_size].copy(), penalty_points[:migration_size].copy())
+              for population, penalty_points in islands]
+
+    for i in range(island_no):
+        population, penalty_points = islands[(i + 1) % island_no]
+        population[-migration_size:], penalty_points[-migration_size:] = elites[i]
+        order = penalty_points.argsort()
+        islands[(i + 1) % island_no] = population[order], penalty_points[order]
+
+    return islands
+
+
+# Island-Model Genetic Algorithm - evolve independent populations in parallel and merge them
+# islands exchange their best chromosomes every migration_interval generations
+# workers use fitness caches with the capacity of cache, their hits and misses are added to its counters
+# ga_mode is "steady-state" (genetic_algorithm.reproduction) or "generational" (generational_reproduction)
+# counters of the workers are added to stats and the best penalty point of each island is emitted every epoch
+def island_reproduction(max_generations, island_no, population_size, instance, migration_interval=10,
+                        migration_size=1, seed=0, processes=None, verbose=False, seeding="random", cache=None,
+                        reject_duplicates=False, ga_mode="steady-state", offspring_no=None, stats=None):
+    islands = [(None, None)] * island_no
+    options = {"verbose": verbose, "seeding": seeding, "cache_capacity": cache.capacity if cache else 0,
+               "reject_duplicates": reject_duplicates, "ga_mode": ga_mode, "offspring_no": offspring_no}
+    plot_data = []
+    epoch = 0
+
+    with get_context("spawn").Pool(processes, initializer=initialize_worker, initargs=(instance,)) as pool:
+        for first_generation in range(0, max_generations, migration_interval):
+            generations = min(migration_interval, max_generations - first_generation)
+            tasks = [(population, penalty_points, population_size, generations, [seed, island, epoch], options)
+                     for island, (population, penalty_points) in enumerate(islands)]
+            results = pool.map(evolve_island, tasks)
+            islands = [(population, penalty_points) for population, penalty_points, _, _, _ in results]
+            plot_data.extend(np.min([island_plot_data for _, _, island_plot_data, _, _ in results], axis=0))
+
+            for _, _, _, counters, island_counters in results:
+                merge(stats, island_counters)
+
+                for key, value in counters.items() if cache else []:
+                    cache.counters[key] += value
+
+            emit(stats, "island_epoch", epoch=epoch, generation=first_generation + generations,
+                 best_penalty_points=[int(penalty_points[0]) for _, penalty_points in islands])
+
+            epoch += 1
+
+            if migration_size > 0 and island_no > 1 and first_generation + generations < max_generations:
+                islands = migrate(islands, migration_size)
+
+    # merge all islands into one population sorted by penalty points
+    population = np.concatenate([population for population, _ in islands])
+    penalty_points = np.concatenate([penalty_points for _, penalty_points in islands])
+    order = penalty_points.argsort()
+    return population[order], penalty_points[order], plot_data
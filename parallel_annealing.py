@@ -0,0 +1,126 @@
+import simulated_annealing as sa
+import island_model as im
+import convergence as cv
+import numpy as np
+from multiprocessing import get_context
+
+
+# derive a 32-bit seed for a chain (and round) so parallel runs are reproducible
+def chain_seed(*keys):
+    return int(np.random.SeedSequence(list(keys)).generate_state(1)[0])
+
+
+# seed numpy and the compiled neighbourhood structures of a worker process
+def seed_worker(seed):
+    np.random.seed(seed)
+    sa.seed(seed)
+
+
+# steps of the convergence trace of a chain recorded by change points (see convergence.record_steps), workers
+# send these back instead of the best penalty point of every iteration
+def trace_steps(recorder):
+    iterations, penalty_points = cv.samples(recorder)
+    return iterations, penalty_points, recorder.state["iterations"]
+
+
+# run a complete annealing schedule from one chromosome in a worker process
+# returns the result of simulated_annealing.anneal with the steps of the trace instead of the plot data
+def anneal_chain(chain):
+    temperature, candidate, penalty_point, seed = chain
+    seed_worker(seed)
+    recorder = cv.create_recorder(change_points=True)
+    best_candidate, best_penalty_point, _, operator_statistics = \
+        sa.anneal(temperature, candidate, penalty_point, im.problem["instance"], verbose=False, recorder=recorder)
+    return best_candidate, best_penalty_point, trace_steps(recorder), operator_statistics
+
+
+# run a fixed number of iterations at a constant temperature in a worker process
+# returns the result of simulated_annealing.markov_chain with the steps of the trace instead of the plot data
+def sample_chain(chain):
+    temperature, iterations, candidate, penalty_point, seed = chain
+    seed_worker(seed)
+    recorder = cv.create_recorder(iterations + 1, change_points=True)
+    result = sa.markov_chain(temperature, 0, 1, iterations, candidate, penalty_point, im.problem["instance"],
+                             verbose=False, recorder=recorder)
+    return result[:5] + (trace_steps(recorder),) + result[6:]
+
+
+# Multi-Start Simulated Annealing - anneal each of the best chain_no chromosomes in parallel
+# population must be sorted by penalty points, the best result across chains is returned
+# together with the operator statistics summed over all chains
+# plot data holds the best penalty point after each iteration of the best chain, unless its trace is passed to
+# recorder instead
+def multi_start_anneal(chain_no, temperature, population, penalty_points, instance, seed=0, processes=None,
+                       recorder=None):
+    chain_no = min(chain_no, len(population))
+    chains = [(temperature, population[chain], penalty_points[chain], chain_seed(seed, chain))
+              for chain in range(chain_no)]
+
+    with get_context("spawn").Pool(processes, initializer=im.initialize_worker, initargs=(instance,)) as pool:
+        results = pool.map(anneal_chain, chains)
+
+    best_candidate, best_penalty_point, steps, _ = min(results, key=lambda result: result[1])
+    operator_statistics = np.sum([result[3] for result in results], axis=0)
+
+    if recorder is None:
+        return best_candidate, best_penalty_point, cv.expand(*steps), operator_statistics
+
+    cv.record_steps(recorder, *steps)
+    return best_candidate, best_penalty_point, np.empty(0, dtype=np.int64), operator_statistics
+
+
+# Parallel Tempering - chains at a geometric ladder of fixed temperatures run in parallel
+# and adjacent chains exchange their states every swap_interval iterations
+# operator statistics are summed over all chains and exchange rounds
+# plot data holds the best penalty point over all chains after each iteration, unless the trace is passed to
+# recorder instead
+def parallel_tempering(chain_no, temperature, population, penalty_points, instance, max_iterations=92100,
+                       swap_interval=500, seed=0, processes=None, recorder=None):
+    # temperatures from the initial temperature down to the final temperature of the annealing schedule
+    temperatures = temperature * np.power(0.0001, np.arange(chain_no) / max(chain_no - 1, 1))
+    candidates = [population[min(chain, len(population) - 1)] for chain in range(chain_no)]
+    chain_penalty_points = [penalty_points[min(chain, len(population) - 1)] for chain in range(chain_no)]
+    best_candidate = population[0]
+    best_penalty_point = penalty_points[0]
+    trace_recorder = recorder if recorder is not None else cv.create_recorder(change_points=True)
+    operator_statistics = np.zeros((4, 6), dtype=np.int64)
+    rng = np.random.default_rng(chain_seed(seed))
+
+    with get_context("spawn").Pool(processes, initializer=im.initialize_worker, initargs=(instance,)) as pool:
+        for exchange in range(0, max_iterations, swap_interval):
+            iterations = min(swap_interval, max_iterations - exchange)
+            chains = [(temperatures[chain], iterations, candidates[chain], chain_penalty_points[chain],
+                       chain_seed(seed, chain, exchange)) for chain in range(chain_no)]
+            results = pool.map(sample_chain, chains)
+            candidates = [result[0] for result in results]
+            chain_penalty_points = [result[1] for result in results]
+
+            for _, _, chain_best_candidate, chain_best_penalty_point, _, _, chain_operator_statistics in results:
+                operator_statistics += chain_operator_statistics
+
+                if chain_best_penalty_point < best_penalty_point:
+                    best_candidate = chain_best_candidate
+                    best_penalty_point = chain_best_penalty_point
+
+            # best penalty point over all chains from each iteration where one of them changes
+            steps = [result[5] for result in results]
+            step_iterations = np.unique(np.concatenate([step[0] for step in steps]))
+            step_penalty_points = np.min([step[1][np.searchsorted(step[0], step_iterations, "right") - 1]
+                                          for step in steps], axis=0)
+            previous = penalty_points[0] if trace_recorder.state["last"] is None else trace_recorder.state["last"]
+            cv.record_steps(trace_recorder, step_iterations, np.minimum(step_penalty_points, previous), iterations)
+
+            # exchange states of adjacent temperatures with the Metropolis criterion
+            for chain in range(chain_no - 1):
+                difference = (chain_penalty_points[chain] - chain_penalty_points[chain + 1]) * \
+                             (1 / temperatures[chain] - 1 / temperatures[chain + 1])
+
+                if difference >= 0 or rng.random() < np.exp(difference):
+                    candidates[chain], candidates[chain + 1] = candidates[chain + 1], candidates[chain]
+                    chain_penalty_points[chain], chain_penalty_points[chain + 1] = \
+                        chain_penalty_points[chain + 1], chain_penalty_points[chain]
+
+    if recorder is None:
+        return best_candidate, best_penalty_point, cv.expand(*trace_steps(trace_recorder)), operator_statistics
+
+    return best_candidate, best_penalty_point, np.empty(0, dtype=np.int64), operator_statistics
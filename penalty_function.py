@@ -1,105 +1,229 @@
 import numpy as np
-from numba import njit
+from numba import njit, prange
+from encoding import slot_index
 
 
 # calculate penalty points based on hard and soft constraints
+# candidate is the match→slot chromosome and slot_match its slot→match inverse index (see encoding.py)
 @njit(cache=True)  # decorate function to be compiled instead of interpreted, speed up code execution by 2-3 times
-def penalty(slot_match, match_match, match_referee, referee_preference):
+def penalty(candidate, slot_match, instance):
+    return score(candidate, slot_match, instance, workspace(instance))
+
+
+# allocate the (day × time slot) buffer used by the scoring kernels
+@njit(cache=True)
+def workspace(instance):
+    # day × time slot matrix storing venue for each presentation
+    # extra last column to handle last time slot
+    return np.zeros((instance.day_no, instance.time_slot_no + 1), dtype=np.int16)
+
+
+# pure scoring kernel behind penalty(): nothing is written and nothing is allocated,
+# so it is safe to call concurrently as long as every caller owns its day_time_slot workspace
+@njit(cache=True)
+def score(candidate, slot_match, instance, day_time_slot):
     penalty_point = 0
     hc_count = 0
     sc_count = 0
-    match_no = slot_match.shape[1]
-    referee_no = referee_preference.shape[0]
-    venue_no = 4
-    time_slot_no = 5
-    day_slot_no = venue_no * time_slot_no
-    day_no = 5
-    match_match = np.copy(match_match)
-    referee_preference[:, 3:6].fill(0)
+    match_no = candidate.shape[0]
+    referee_no = instance.referee_preference.shape[0]
+    match_match = instance.match_match
+    concurrent_slots = instance.concurrent_slots
 
     # HC02: no staff can attend more than 1 presentations concurrently
     for match in range(match_no):
-        slot = np.where(slot_match[:, match] == 1)[0][0]
-        min_concurrent_slot = (slot % time_slot_no) + (slot // day_slot_no) * day_slot_no
-        max_concurrent_slot = min_concurrent_slot + day_slot_no
+        for concurrent_slot in concurrent_slots[candidate[match]]:
+            concurrent_match = slot_match[concurrent_slot]
 
-        for concurrent_slot in range(min_concurrent_slot, max_concurrent_slot, time_slot_no):
-            concurrent_match = np.where(slot_match[concurrent_slot] == 1)[0]
+            # each pair of matches is only counted from the match with the smaller index
+            if concurrent_match > match and match_match[match][concurrent_match] == 1:
+                penalty_point += 1000
+                hc_count += 1
 
-            if len(concurrent_match) != 0:
-                concurrent_match = concurrent_match[0]
+    for referee in range(referee_no):  # most time-consuming loop
+        referee_point, referee_sc_count, _, _, _ = referee_penalty(candidate, instance, referee, day_time_slot)
+        penalty_point += referee_point
+        sc_count += referee_sc_count
 
-                if match_match[match][concurrent_match] == 1:
-                    match_match[match][concurrent_match] = -1
-                    match_match[concurrent_match][match] = -1
-                    penalty_point += 1000
-                    hc_count += 1
+    if instance.move_weight > 0:
+        for match in range(match_no):
+            penalty_point += moved_penalty(candidate, instance, match)
 
-    # 5(day) × 5(time slot) matrix storing venue for each presentation
-    day_time_slot = np.zeros((day_no, time_slot_no + 1), dtype=np.int8)  # extra last column to handle last time slot
+    return penalty_point, hc_count, sc_count
 
-    for referee in range(referee_no):  # most time-consuming loop
-        referied_matches = np.where(match_referee[:, referee] == 1)[0]
-        day_time_slot.fill(0)
-
-        for referied_match in referied_matches:
-            referied_slot = np.where(slot_match[:, referied_match] == 1)[0][0]
-            referied_day = referied_slot // day_slot_no
-            referied_time_slot = referied_slot % time_slot_no
-            referied_venue = (referied_slot // time_slot_no) % venue_no + 1  # add 1 to avoid conflict with 0
-            day_time_slot[referied_day][referied_time_slot] = referied_venue
-
-        consecutive_preference = referee_preference[referee][0]  # SC01: consecutive presentations
-        day_count = 0
-        venue_changes = 0
-
-        for day in range(day_no):
-            is_consecutive = False
-            is_this_day = False
-            consecutive_count = 0
-            previous_venue = 0
-
-            for time_slot in range(time_slot_no + 1):
-                if day_time_slot[day][time_slot] != 0:
-                    venue = day_time_slot[day][time_slot]
-
-                    # if current presentation is consecutive with previous presentation
-                    # this check is ignored if it is the first presentation of group of consecutive presentations
-                    if is_consecutive and venue != previous_venue:
-                        venue_changes += 1
-
-                    is_consecutive = True
-                    is_this_day = True
-                    consecutive_count += 1
-                    previous_venue = venue
-                else:
-                    # calculate penalty points for a group of consecutive presentations (might has only 1 presentation)
-                    if is_consecutive:
-                        if consecutive_count < consecutive_preference:  # encourage presentations to be consecutive
-                            penalty_point += (consecutive_preference - consecutive_count) * 1
-                            referee_preference[referee][3] += 1
-                        elif consecutive_count > consecutive_preference:  # exceeds maximum consecutive preference
-                            penalty_point += (consecutive_count - consecutive_preference) * 10
-                            referee_preference[referee][3] += 1
-                            sc_count += 1
-
-                    is_consecutive = False
-
-            if is_this_day:  # a presentation takes place on this day
-                day_count += 1
-
-        days_preference = referee_preference[referee][1]  # SC02: number of days
-        referee_preference[referee][4] = day_count
-
-        if day_count > days_preference:
-            penalty_point += (day_count - days_preference) * 10
-            sc_count += 1
-
-        venue_preference = referee_preference[referee][2]  # SC03: change of venue
-        referee_preference[referee][5] = venue_changes
-
-        if venue_preference == 1 and venue_changes > 0:  # supervisor does not want to change venue
-            penalty_point += venue_changes * 10
-            sc_count += 1
 
-    return penalty_point, hc_count, sc_count
+# penalty points for moving a match away from its slot in the published schedule (incremental rescheduling)
+@njit(cache=True)
+def moved_penalty(candidate, instance, match):
+    published_slot = instance.published_slots[match]
+    return instance.move_weight if published_slot != -1 and candidate[match] != published_slot else 0
+
+
+# per-referee breakdown for reporting: number of groups of consecutive presentations penalised by SC01,
+# number of days (SC02) and number of venue changes (SC03) of each referee
+@njit(cache=True)
+def referee_statistics(candidate, instance):
+    referee_no = instance.referee_preference.shape[0]
+    statistics = np.zeros((referee_no, 3), dtype=np.int64)
+    day_time_slot = workspace(instance)
+
+    for referee in range(referee_no):
+        _, _, consecutive_groups, day_count, venue_changes = \
+            referee_penalty(candidate, instance, referee, day_time_slot)
+        statistics[referee][0] = consecutive_groups
+        statistics[referee][1] = day_count
+        statistics[referee][2] = venue_changes
+
+    return statistics
+
+
+# calculate penalty points of SC01, SC02 and SC03 for a single referee
+# day_time_slot is a reusable (day × time slot) buffer so that no matrix is allocated per referee
+@njit(cache=True)
+def referee_penalty(candidate, instance, referee, day_time_slot):
+    penalty_point = 0
+    sc_count = 0
+    consecutive_groups = 0
+    time_slot_no = day_time_slot.shape[1] - 1
+    day_no = day_time_slot.shape[0]
+    referee_preference = instance.referee_preference
+    day_time_slot.fill(0)
+
+    for referied_match in instance.referee_matches[instance.referee_pointer[referee]:
+                                                   instance.referee_pointer[referee + 1]]:
+        referied_slot = candidate[referied_match]
+        referied_day = instance.slot_day[referied_slot]
+        referied_time_slot = instance.slot_time[referied_slot]
+        referied_venue = instance.slot_venue[referied_slot] + 1  # add 1 to avoid conflict with 0
+        day_time_slot[referied_day][referied_time_slot] = referied_venue
+
+    consecutive_preference = referee_preference[referee][0]  # SC01: consecutive presentations
+    day_count = 0
+    venue_changes = 0
+
+    for day in range(day_no):
+        is_consecutive = False
+        is_this_day = False
+        consecutive_count = 0
+        previous_venue = 0
+
+        for time_slot in range(time_slot_no + 1):
+            if day_time_slot[day][time_slot] != 0:
+                venue = day_time_slot[day][time_slot]
+
+                # if current presentation is consecutive with previous presentation
+                # this check is ignored if it is the first presentation of group of consecutive presentations
+                if is_consecutive and venue != previous_venue:
+                    venue_changes += 1
+
+                is_consecutive = True
+                is_this_day = True
+                consecutive_count += 1
+                previous_venue = venue
+            else:
+                # calculate penalty points for a group of consecutive presentations (might has only 1 presentation)
+                if is_consecutive:
+                    if consecutive_count < consecutive_preference:  # encourage presentations to be consecutive
+                        penalty_point += (consecutive_preference - consecutive_count) * 1
+                        consecutive_groups += 1
+                    elif consecutive_count > consecutive_preference:  # exceeds maximum consecutive preference
+                        penalty_point += (consecutive_count - consecutive_preference) * 10
+                        consecutive_groups += 1
+                        sc_count += 1
+
+                is_consecutive = False
+
+        if is_this_day:  # a presentation takes place on this day
+            day_count += 1
+
+    days_preference = referee_preference[referee][1]  # SC02: number of days
+
+    if day_count > days_preference:
+        penalty_point += (day_count - days_preference) * 10
+        sc_count += 1
+
+    venue_preference = referee_preference[referee][2]  # SC03: change of venue
+
+    if venue_preference == 1 and venue_changes > 0:  # supervisor does not want to change venue
+        penalty_point += venue_changes * 10
+        sc_count += 1
+
+    return penalty_point, sc_count, consecutive_groups, day_count, venue_changes
+
+
+# count HC02 violations between a match and the matches scheduled concurrently with it
+@njit(cache=True)
+def match_conflicts(candidate, slot_match, instance, match):
+    conflicts = 0
+
+    for concurrent_slot in instance.concurrent_slots[candidate[match]]:
+        concurrent_match = slot_match[concurrent_slot]
+
+        if concurrent_match != -1 and instance.match_match[match][concurrent_match] == 1:
+            conflicts += 1
+
+    return conflicts
+
+
+# penalty points of the terms a neighbourhood move can change, the HC02 and moved-match terms of the moved matches
+# and the SC01/SC02/SC03 terms of their referees (a conflict between both moved matches is counted once)
+@njit(cache=True)
+def move_penalty(candidate, slot_match, match1, match2, instance, day_time_slot):
+    conflicts = match_conflicts(candidate, slot_match, instance, match1)
+
+    if match2 != -1:
+        conflicts += match_conflicts(candidate, slot_match, instance, match2)
+
+        if instance.match_match[match1][match2] == 1 and is_concurrent(candidate[match1], candidate[match2], instance):
+            conflicts -= 1
+
+    penalty_point = conflicts * 1000 + moved_penalty(candidate, instance, match1)
+
+    if match2 != -1:
+        penalty_point += moved_penalty(candidate, instance, match2)
+
+    for referee in instance.match_referees[instance.match_pointer[match1]:instance.match_pointer[match1 + 1]]:
+        penalty_point += referee_penalty(candidate, instance, referee, day_time_slot)[0]
+
+    if match2 != -1:
+        for referee in instance.match_referees[instance.match_pointer[match2]:instance.match_pointer[match2 + 1]]:
+            if instance.match_referee[match1][referee] == 1:  # already scored with the first match
+                continue
+
+            penalty_point += referee_penalty(candidate, instance, referee, day_time_slot)[0]
+
+    return penalty_point
+
+
+# calculate the change in penalty points caused by a neighbourhood move
+# only the terms of the moved matches and their referees are recomputed,
+# so current penalty point + delta is exactly the penalty point of the new candidate
+@njit(cache=True)
+def delta_penalty(candidate, slot_match, new_candidate, new_slot_match, match1, match2, instance, day_time_slot):
+    return move_penalty(new_candidate, new_slot_match, match1, match2, instance, day_time_slot) - \
+        move_penalty(candidate, slot_match, match1, match2, instance, day_time_slot)
+
+
+# check if two different slots take place on the same day and time slot (different venues)
+@njit(cache=True)
+def is_concurrent(slot1, slot2, instance):
+    return slot1 != slot2 and instance.slot_day[slot1] == instance.slot_day[slot2] and \
+        instance.slot_time[slot1] == instance.slot_time[slot2]
+
+
+# calculate penalty points, hard and soft constraint counts of a whole (population_size × match_no) population
+# chromosomes are scored in parallel over the population axis and referee_preference is only read
+@njit(cache=True, parallel=True)
+def batch_penalty(population, instance):
+    population_size = population.shape[0]
+    slot_no = instance.available.shape[0]
+    penalty_points = np.zeros(population_size, dtype=np.int64)
+    hc_counts = np.zeros(population_size, dtype=np.int64)
+    sc_counts = np.zeros(population_size, dtype=np.int64)
+
+    for i in prange(population_size):
+        candidate = population[i]
+        penalty_points[i], hc_counts[i], sc_counts[i] = \
+            score(candidate, slot_index(candidate, slot_no), instance, workspace(instance))
+
+    return penalty_points, hc_counts, sc_counts
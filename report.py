@@ -0,0 +1,124 @@
+import os
+import json
+import numpy as np
+from multiprocessing import get_context
+
+# reporting stage - convergence graph, schedule table and per-referee breakdown of a result
+# matplotlib and prettytable are only imported when a report is rendered, graphs are drawn on an Agg canvas without
+# pyplot (no display and no global figure state) unless they are shown, so reports can be rendered after the
+# solver is done, on a background process (see create_reporter), while the solver goes on with the next run
+
+
+# draw the best penalty points over the iterations and save the graph to filename (png)
+# the graph window is only shown (blocking) if show is set, an empty trace (e.g. a run stopped before its first
+# sample) plots the final penalty point alone
+def plot_convergence(filename, iterations, penalty_points, constraint_counts, show=False):
+    if len(iterations) == 0:
+        iterations, penalty_points = [0], [constraint_counts[0]]
+
+    if show:
+        import matplotlib.pyplot as plt
+        figure = plt.figure()
+    else:
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        figure = Figure()
+        FigureCanvasAgg(figure)
+
+    axes = figure.add_subplot()
+    axes.set_title(f"Improvement of match Scheduling over Iterations\n"
+                   f"[Hard Constraints Violated:] {constraint_counts[1]} "
+                   f"[Soft Constraints Violated:] {constraint_counts[2]}\n"
+                   f"[Final Penalty Points:] {constraint_counts[0]}")
+    axes.set_xlabel("Number of Iterations")
+    axes.set_ylabel("Penalty Points")
+    axes.axis([0, iterations[-1] + 1, 0, max(penalty_points)])
+    axes.plot(iterations, penalty_points, "r--", drawstyle="steps-post")
+    axes.grid(True)
+    figure.savefig(filename)
+
+    if show:
+        plt.show()
+        plt.close(figure)
+
+
+# schedule table with a row per day and venue and a column per time slot, slot_match marks empty slots with -1
+def schedule_table(slot_match, geometry):
+    from prettytable import PrettyTable
+
+    venue_no = len(geometry.venues)
+    time_slot_no = len(geometry.time_slots)
+    schedule = PrettyTable()
+    schedule.field_names = ["Day", "Venue"] + list(geometry.time_slots)
+
+    for day, day_name in enumerate(geometry.days):
+        for venue, venue_name in enumerate(geometry.venues):
+            first_slot = (day * venue_no + venue) * time_slot_no
+            schedule.add_row([day_name if venue == 0 else "", venue_name] +
+                             ["" if match == -1 else f"M{match + 1}"
+                              for match in slot_match[first_slot:first_slot + time_slot_no]])
+
+        schedule.add_row([""] * (2 + time_slot_no))
+
+    return schedule
+
+
+# one line per referee comparing its preferences (SC01, SC02, SC03) with the schedule
+def referee_lines(referee_statistics, referee_preference):
+    return [f"[Referee R{str(referee + 1).zfill(3)}] "
+            f"[No. of Continuous matches: {statistics[0]}] "
+            f"[Day Preference: {preference[1]}] "
+            f"[Days: {statistics[1]}] "
+            f"[Venue Change Preference: {'No' if preference[2] else 'Yes'}] "
+            f"[Venue Changes: {statistics[2]}]"
+            for referee, (statistics, preference) in enumerate(zip(referee_statistics, referee_preference))]
+
+
+# schedule table followed by the referee breakdown, as printed by data.write
+def schedule_report(slot_match, geometry, referee_statistics, referee_preference):
+    return "\n".join([f"\n {schedule_table(slot_match, geometry)} \n"] +
+                     referee_lines(referee_statistics, referee_preference))
+
+
+# render the report of a json result written by data.write_result, the graph and schedule report are saved next
+# to it as graph [run id].png and schedule [run id].txt, the report is printed if verbose is set
+# returns the names of the files written
+def render(path, show=False, verbose=False):
+    from data import Geometry
+
+    with open(path) as file:
+        result = json.load(file)
+
+    geometry = Geometry(**result["geometry"])
+    slot_match = np.full(len(geometry.days) * len(geometry.venues) * len(geometry.time_slots), -1)
+
+    for entry in result["schedule"]:
+        slot_match[entry["slot"] - 1] = int(entry["match"][1:]) - 1
+
+    constraint_counts = [result["penalty_point"], result["hard_constraints_violated"],
+                         result["soft_constraints_violated"]]
+    directory = os.path.dirname(path)
+    graph_name = os.path.join(directory, f"graph [{result['run_id']}].png")
+    report_name = os.path.join(directory, f"schedule [{result['run_id']}].txt")
+    plot_convergence(graph_name, result["convergence"]["iterations"], result["convergence"]["penalty_points"],
+                     constraint_counts, show)
+    report = schedule_report(slot_match, geometry, result["referee_statistics"], result["referee_preference"])
+
+    with open(report_name, 'w') as file:
+        file.write(report + "\n")
+
+    if verbose:
+        print(report)
+
+    return [graph_name, report_name]
+
+
+# background process rendering the reports passed to submit, so solver processes never wait on plotting or
+# terminal output; call reporter.close() and reporter.join() to wait for the reports submitted
+def create_reporter(processes=1):
+    return get_context("spawn").Pool(processes)
+
+
+# render the report of a json result on a reporter, returns the pending result of render
+def submit(reporter, path, verbose=False):
+    return reporter.apply_async(render, (os.path.abspath(path), False, verbose))
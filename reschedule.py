@@ -0,0 +1,109 @@
+import argparse
+import numpy as np
+from timeit import default_timer as timer
+
+import data as dt
+import simulated_annealing as sa
+from penalty_function import penalty, referee_statistics
+from encoding import slot_index
+
+# options of reschedule(), any option left out of the config keeps its default
+# move_weight is the penalty for each match moved away from its published slot, so only moves that gain more than
+# that are kept; the short annealing run starts at temperature and cools by alpha every iteration down to
+# 0.0001 × temperature (about 9200 iterations with alpha 0.999, a tenth of a full hybrid_system run)
+DEFAULT_CONFIG = {"move_weight": 50,
+                  "temperature": 20,
+                  "alpha": 0.999,
+                  "seed": None,
+                  "verbose": False}
+
+
+# repair a published schedule after late constraint changes without running the genetic algorithm again
+# matches whose slot is no longer available (or that have no slot) are placed along the shortest augmenting
+# paths (see data.augment), so only the matches on those paths leave their published slot
+# raises ValueError if the matches cannot all be given an available slot
+def repair(instance, published):
+    slot_no = instance.available.shape[0]
+    candidate = np.asarray(published, dtype=np.int32).copy()
+    scheduled = candidate != -1
+    displaced = ~scheduled
+    displaced[scheduled] = ~instance.available[candidate[scheduled], np.flatnonzero(scheduled)]
+    candidate[displaced] = -1
+    slot_owner = np.full(slot_no, -1)
+    slot_owner[candidate[~displaced]] = np.flatnonzero(~displaced)
+    available_counts = np.diff(instance.available_pointer)
+
+    for match in sorted(np.flatnonzero(displaced), key=lambda match: available_counts[match]):
+        if not dt.augment(match, instance.available_pointer, instance.available_slots, slot_owner, candidate):
+            raise ValueError(f"infeasible tournament: match {match + 1} cannot be given an available slot")
+
+    return candidate
+
+
+# incremental rescheduling - repair the published schedule and improve it with a short simulated annealing run
+# that is penalised by move_weight for every match moved away from its published slot
+# returns the same fields as hybrid_system.solve (constraint counts without the moved-match penalty) and the
+# numbers of the moved matches
+def reschedule(instance, published, config=None):
+    config = dict(DEFAULT_CONFIG, **(config or {}))
+    slot_no = instance.available.shape[0]
+    published = np.asarray(published)
+
+    if config["seed"] is not None:
+        np.random.seed(config["seed"])
+        sa.seed(config["seed"])
+
+    candidate = repair(instance, published)
+    published_instance = instance._replace(published_slots=np.asarray(published, dtype=np.int64),
+                                           move_weight=config["move_weight"])
+    penalty_point = penalty(candidate, slot_index(candidate, slot_no), published_instance)[0]
+    _, _, best_candidate, best_penalty_point, _, plot_data, operator_statistics = \
+        sa.markov_chain(config["temperature"], 0.0001 * config["temperature"], config["alpha"], None, candidate,
+                        penalty_point, published_instance, verbose=config["verbose"])
+    constraint_counts = penalty(best_candidate, slot_index(best_candidate, slot_no), instance)
+
+    return {"candidate": best_candidate,
+            "penalty_point": best_penalty_point,
+            "constraint_counts": constraint_counts,
+            "referee_statistics": referee_statistics(best_candidate, instance),
+            "operator_statistics": operator_statistics,
+            "moved_matches": [int(match) + 1 for match in np.flatnonzero((published != -1) &
+                                                                         (best_candidate != published))],
+            "plot_iterations": np.arange(len(plot_data)),
+            "plot_data": plot_data}
+
+
+# reschedule the tournament in input_files from a previous result csv written by data.write
+# late constraint changes are either already in the input files or given as extra csv files in the format of
+# HC04.csv (hc04) and HC03.csv (hc03), the previous result may also be a json or .npz result (see data.write_result)
+# the new schedule, graph, result csv and json result are written to the current directory
+def reschedule_system(result_path, directory="input_files", hc04=None, hc03=None, config=None, show=False):
+    geometry, instance = dt.load_tournament(directory)
+    instance = dt.restrict(instance, *dt.load_restrictions(hc04, hc03))
+    published = dt.read_result(result_path, instance.match_referee.shape[0])
+    config = dict({"verbose": True}, **(config or {}))
+    result = reschedule(instance, published, config)
+    result["run_id"] = dt.write(result["candidate"], instance, geometry, result["referee_statistics"],
+                                result["constraint_counts"], result["plot_data"], show, config["verbose"],
+                                result["plot_iterations"])
+    dt.write_result(result, instance, geometry, result["run_id"])
+
+    if config["verbose"]:
+        print(f"\nMoved matches: {', '.join(f'M{match}' for match in result['moved_matches']) or 'none'}")
+
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reschedule a published tournament after late constraint changes")
+    parser.add_argument("result", help="result csv of the published schedule")
+    parser.add_argument("--directory", default="input_files")
+    parser.add_argument("--hc04", default=None, help="csv of new staff unavailability in the format of HC04.csv")
+    parser.add_argument("--hc03", default=None, help="csv of new venue unavailability in the format of HC03.csv")
+    parser.add_argument("--move-weight", type=int, default=DEFAULT_CONFIG["move_weight"])
+    parser.add_argument("--seed", type=int, default=None)
+    arguments = parser.parse_args()
+    start = timer()
+    reschedule_system(arguments.result, arguments.directory, arguments.hc04, arguments.hc03,
+                      {"move_weight": arguments.move_weight, "seed": arguments.seed})
+    print("\nExecution Time of Rescheduling:", round(timer() - start, 2), "seconds")
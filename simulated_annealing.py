@@ -1,160 +1,404 @@
-from penalty_function import penalty
+from penalty_function import move_penalty, workspace
+from encoding import slot_index
+from instrumentation import emit
+from convergence import record
+from checkpoint import due, save
+from stopping import start_phase, exhausted, spend, remaining_evaluations, remaining_stagnation, cooling_rate
 import numpy as np
+from timeit import default_timer as timer
 from numba import njit
 
 
+# random picks a neighbourhood structure makes before giving up on finding a move
+MAX_ATTEMPTS = 1000
+
+
 # interchange two slots of a professor
+# each neighbourhood structure updates the match→slot candidate and its slot→match index in place
+# and returns the moved matches with their original slots (-1 if unused), or only -1 if no move was found,
+# followed by the number of random picks it made
 @njit(cache=True)
-def neighbourhood_structure1(candidate, match_referee):
-    referee_no = match_referee.shape[1]
+def neighbourhood_structure1(candidate, slot_match, instance):
+    available = instance.available
+    referee_no = instance.referee_preference.shape[0]
 
-    while True:
+    for attempt in range(MAX_ATTEMPTS):
         random_referee = np.random.randint(referee_no)
-        referied_matches = np.where(match_referee[:, random_referee] == 1)[0]
+        referied_matches = instance.referee_matches[instance.referee_pointer[random_referee]:
+                                                    instance.referee_pointer[random_referee + 1]]
 
         if len(referied_matches) > 1:
             # get 2 random presentations supervised by the supervisor
             match1 = referied_matches[np.random.randint(len(referied_matches))]
-            slot1 = np.where(candidate[:, match1] == 1)[0][0]
+            slot1 = candidate[match1]
             match2 = referied_matches[np.random.randint(len(referied_matches))]
-            slot2 = np.where(candidate[:, match2] == 1)[0][0]
+            slot2 = candidate[match2]
 
             # interchange the slots of the two presentations
-            if candidate[slot2][match1] == 0 and candidate[slot1][match2] == 0:
-                candidate[slot1][match1] = candidate[slot2][match2] = 0
-                candidate[slot2][match1] = candidate[slot1][match2] = 1
-                break
+            if match1 != match2 and available[slot2][match1] and available[slot1][match2]:
+                candidate[match1], candidate[match2] = slot2, slot1
+                slot_match[slot1], slot_match[slot2] = match2, match1
+                return match1, slot1, match2, slot2, attempt + 1
+
+    return -1, -1, -1, -1, MAX_ATTEMPTS
 
 
 # change venue of presentation (time-slot remains the same)
 @njit(cache=True)
-def neighbourhood_structure2(candidate):
-    match_no = candidate.shape[1]
-    venue_no = 4
-    time_slot_no = 5
-    day_slot_no = venue_no * time_slot_no
+def neighbourhood_structure2(candidate, slot_match, instance):
+    available = instance.available
+    match_no = candidate.shape[0]
 
-    while True:
+    for attempt in range(MAX_ATTEMPTS):
         random_match = np.random.randint(match_no)
-        slot = np.where(candidate[:, random_match] == 1)[0][0]
-        min_concurrent_slot = (slot % time_slot_no) + (slot // day_slot_no) * day_slot_no
-        max_concurrent_slot = min_concurrent_slot + day_slot_no
+        slot = candidate[random_match]
 
         # find a concurrent slot that is available and empty
-        for concurrent_slot in range(min_concurrent_slot, max_concurrent_slot, time_slot_no):
-            if candidate[concurrent_slot][random_match] == 0 and \
-                    np.count_nonzero(candidate[concurrent_slot] == 1) == 0:
-                candidate[slot][random_match] = 0
-                candidate[concurrent_slot][random_match] = 1
-                return
+        for concurrent_slot in instance.concurrent_slots[slot]:
+            if available[concurrent_slot][random_match] and slot_match[concurrent_slot] == -1:
+                candidate[random_match] = concurrent_slot
+                slot_match[slot] = -1
+                slot_match[concurrent_slot] = random_match
+                return random_match, slot, -1, -1, attempt + 1
+
+    return -1, -1, -1, -1, MAX_ATTEMPTS
 
 
 # assign presentation to a random empty slot
+# the slot is drawn from the available slots of the presentation that are empty
 @njit(cache=True)
-def neighbourhood_structure3(candidate):
-    slot_no = candidate.shape[0]
-    match_no = candidate.shape[1]
+def neighbourhood_structure3(candidate, slot_match, instance):
+    match_no = candidate.shape[0]
     random_match = np.random.randint(match_no)
-    original_slot = np.where(candidate[:, random_match] == 1)[0][0]
+    original_slot = candidate[random_match]
+    slots = instance.available_slots[instance.available_pointer[random_match]:
+                                     instance.available_pointer[random_match + 1]]
+    free_slot_no = 0
 
-    while True:
-        random_slot = np.random.randint(slot_no)
+    for slot in slots:
+        if slot_match[slot] == -1:
+            free_slot_no += 1
 
-        # if the slot is available and empty (other presentations are not using the slot)
-        if candidate[random_slot][random_match] == 0 and np.count_nonzero(candidate[random_slot] == 1) == 0:
-            candidate[original_slot][random_match] = 0
-            candidate[random_slot][random_match] = 1
-            break
+    if free_slot_no == 0:
+        return -1, -1, -1, -1, 1
+
+    # take the chosen empty slot (other presentations are not using the slot)
+    chosen = np.random.randint(free_slot_no)
+
+    for slot in slots:
+        if slot_match[slot] == -1:
+            if chosen == 0:
+                candidate[random_match] = slot
+                slot_match[original_slot] = -1
+                slot_match[slot] = random_match
+                return random_match, original_slot, -1, -1, 1
+
+            chosen -= 1
+
+    return -1, -1, -1, -1, 1
 
 
 # find a random presentation and assign a presentation that has the same supervisor
 # to the slot next to the random presentation
 # aims to increase the number of consecutive presentations
 @njit(cache=True)
-def neighbourhood_structure4(candidate, match_match):
-    match_no = candidate.shape[1]
-    venue_no = 4
-    time_slot_no = 5
-    day_slot_no = venue_no * time_slot_no
+def neighbourhood_structure4(candidate, slot_match, instance):
+    available = instance.available
+    slot_no = slot_match.shape[0]
+    match_no = candidate.shape[0]
 
-    while True:
+    for attempt in range(MAX_ATTEMPTS):
         current_match = np.random.randint(match_no)
-        current_slot = np.where(candidate[:, current_match] == 1)[0][0]
-        adjacent_slot = (current_slot - 1) % 100 if np.random.random() < 0.5 else (current_slot + 1) % 100
+        current_slot = candidate[current_match]
+        adjacent_slot = (current_slot - 1) % slot_no if np.random.random() < 0.5 else (current_slot + 1) % slot_no
 
         # find all time slots after the current slot
         # the slot with the same venue as the current slot is given priority
-        min_concurrent_slot = (adjacent_slot % time_slot_no) + (adjacent_slot // day_slot_no) * day_slot_no
-        max_concurrent_slot = min_concurrent_slot + day_slot_no
-        adjacent_concurrent_slots = [adjacent_slot]
+        adjacent_concurrent_slots = instance.concurrent_slots[adjacent_slot]
 
-        for concurrent_slot in range(min_concurrent_slot, max_concurrent_slot, time_slot_no):
-            if concurrent_slot != adjacent_slot:
-                adjacent_concurrent_slots.append(concurrent_slot)
+        for i in range(len(adjacent_concurrent_slots) + 1):
+            adjacent_concurrent_slot = adjacent_slot if i == 0 else adjacent_concurrent_slots[i - 1]
 
-        for adjacent_concurrent_slot in adjacent_concurrent_slots:
-            # check if the slot is available (if the slot is unavailable, the row is all -1)
-            if np.all(candidate[adjacent_concurrent_slot]):
+            if i > 0 and adjacent_concurrent_slot == adjacent_slot:
                 continue
 
             # check if the slot is empty
-            if np.count_nonzero(candidate[adjacent_concurrent_slot] == 1) == 0:
-                overlapping_matches = np.where(match_match[current_match])[0]
+            if slot_match[adjacent_concurrent_slot] == -1:
+                overlapping_matches = instance.conflict_matches[instance.conflict_pointer[current_match]:
+                                                                instance.conflict_pointer[current_match + 1]]
 
                 if len(overlapping_matches) > 0:
                     chosen_match = overlapping_matches[np.random.randint(len(overlapping_matches))]
 
-                    if candidate[adjacent_concurrent_slot][chosen_match] == 0:
-                        original_slot = np.where(candidate[:, chosen_match] == 1)[0][0]
-                        candidate[original_slot][chosen_match] = 0
-                        candidate[adjacent_concurrent_slot][chosen_match] = 1
-                        return
+                    # check if the slot is available for the chosen match
+                    if available[adjacent_concurrent_slot][chosen_match]:
+                        original_slot = candidate[chosen_match]
+                        candidate[chosen_match] = adjacent_concurrent_slot
+                        slot_match[original_slot] = -1
+                        slot_match[adjacent_concurrent_slot] = chosen_match
+                        return chosen_match, original_slot, -1, -1, attempt + 1
 
+    return -1, -1, -1, -1, MAX_ATTEMPTS
 
-# Simulated-Annealing Algorithm - perform random walk in space until temperature drops below a limit
-def anneal(initial_temperature, initial_candidate, penalty_point, match_match,
-           match_referee, referee_preference):
-    temperature = initial_temperature
-    final_temperature = 0.0001 * initial_temperature
-    alpha = 0.9999  # annealing schedule to decrease temperature
-    current_candidate = initial_candidate
-    best_candidate = initial_candidate
-    current_penalty_point = penalty_point
-    best_penalty_point = penalty_point
-    iteration = 100  # initial iteration after performing genetic algorithm
-    neighbourhood_structure_no = 4
-    plot_data = []
 
-    while temperature >= final_temperature:
-        new_candidate = np.copy(current_candidate)
-        neighbourhood_structure = np.random.randint(neighbourhood_structure_no)
+# seed the random generator used inside compiled neighbourhood structures (separate from numpy's generator)
+@njit(cache=True)
+def seed(value):
+    np.random.seed(value)
+
+
+# put two matches (match2 may be -1) into the given slots, used to undo and redo a neighbourhood move
+# the slots they occupy now are freed first, so this also restores swapped matches
+@njit(cache=True)
+def place_matches(candidate, slot_match, match1, slot1, match2, slot2):
+    slot_match[candidate[match1]] = -1
+
+    if match2 != -1:
+        slot_match[candidate[match2]] = -1
+        candidate[match2] = slot2
+        slot_match[slot2] = match2
+
+    candidate[match1] = slot1
+    slot_match[slot1] = match1
+
+
+# adaptive operator selection - roulette over the neighbourhood structures where each structure gets
+# minimum_probability plus a share of the rest proportional to its quality (recent rate of improving moves)
+@njit(cache=True)
+def select_operator(quality, minimum_probability):
+    operator_no = len(quality)
+    total_quality = quality.sum()
+    random_number = np.random.random()
+    cumulative_probability = 0.0
+
+    for operator in range(operator_no):
+        share = quality[operator] / total_quality if total_quality > 0 else 1 / operator_no
+        cumulative_probability += minimum_probability + (1 - operator_no * minimum_probability) * share
+
+        if random_number < cumulative_probability:
+            return operator
+
+    return operator_no - 1
+
+
+# initial temperature for a candidate, the mean penalty points lost by sample_no random worsening moves of the
+# neighbourhood structures (1 if no worsening move is found), used when the spread of the GA population is 0
+@njit(cache=True)
+def sample_temperature(candidate, instance, sample_no=100):
+    candidate = np.copy(candidate)
+    slot_match = slot_index(candidate, instance.available.shape[0])
+    day_time_slot = workspace(instance)
+    total_difference = 0
+    worsening_moves = 0
+
+    for sample in range(sample_no):
+        neighbourhood_structure = np.random.randint(4)
 
         if neighbourhood_structure == 0:
-            neighbourhood_structure1(new_candidate, match_referee)
+            match1, old_slot1, match2, old_slot2, _ = neighbourhood_structure1(candidate, slot_match, instance)
         elif neighbourhood_structure == 1:
-            neighbourhood_structure2(new_candidate)
+            match1, old_slot1, match2, old_slot2, _ = neighbourhood_structure2(candidate, slot_match, instance)
         elif neighbourhood_structure == 2:
-            neighbourhood_structure3(new_candidate)
+            match1, old_slot1, match2, old_slot2, _ = neighbourhood_structure3(candidate, slot_match, instance)
         else:
-            neighbourhood_structure4(new_candidate, match_match)
+            match1, old_slot1, match2, old_slot2, _ = neighbourhood_structure4(candidate, slot_match, instance)
+
+        if match1 == -1:
+            continue
 
-        new_penalty_point = \
-            penalty(new_candidate, match_match, match_referee, referee_preference)[0]
-        difference = new_penalty_point - current_penalty_point
+        # score the move and undo it
+        difference = move_penalty(candidate, slot_match, match1, match2, instance, day_time_slot)
+        place_matches(candidate, slot_match, match1, old_slot1, match2, old_slot2)
+        difference -= move_penalty(candidate, slot_match, match1, match2, instance, day_time_slot)
 
-        if difference < 0 or np.random.random() < np.exp((-1 * difference) / temperature):
-            current_candidate = new_candidate
-            current_penalty_point = new_penalty_point
+        if difference > 0:
+            total_difference += difference
+            worsening_moves += 1
 
-        if current_penalty_point < best_penalty_point:
-            best_candidate = current_candidate
-            best_penalty_point = current_penalty_point
+    return total_difference / worsening_moves if worsening_moves > 0 else 1.0
+
+
+# compiled annealing loop, runs until temperature drops below final_temperature or trace is full
+# moves are applied to the current candidate and its slot index in place and undone if rejected,
+# the best candidate is only copied when it improves; penalty points are updated in place and the
+# best penalty point after each iteration is recorded in trace
+# quality is updated with rate adaptation_rate and selected/accepted/improved moves, penalty points gained,
+# moves not found and random picks are counted per neighbourhood structure in operator_statistics
+# returns the number of iterations performed and the final temperature
+@njit(cache=True)
+def chain_kernel(temperature, final_temperature, alpha, current_candidate, current_slot_match, current_penalty,
+                 best_candidate, best_penalty, instance, day_time_slot, trace, quality, operator_statistics,
+                 adaptation_rate, minimum_probability):
+    iterations = 0
+
+    while temperature >= final_temperature and iterations < len(trace):
+        neighbourhood_structure = select_operator(quality, minimum_probability)
+
+        if neighbourhood_structure == 0:
+            match1, old_slot1, match2, old_slot2, attempts = \
+                neighbourhood_structure1(current_candidate, current_slot_match, instance)
+        elif neighbourhood_structure == 1:
+            match1, old_slot1, match2, old_slot2, attempts = \
+                neighbourhood_structure2(current_candidate, current_slot_match, instance)
+        elif neighbourhood_structure == 2:
+            match1, old_slot1, match2, old_slot2, attempts = \
+                neighbourhood_structure3(current_candidate, current_slot_match, instance)
+        else:
+            match1, old_slot1, match2, old_slot2, attempts = \
+                neighbourhood_structure4(current_candidate, current_slot_match, instance)
+
+        operator_statistics[neighbourhood_structure, 0] += 1
+        operator_statistics[neighbourhood_structure, 4] += match1 == -1
+        operator_statistics[neighbourhood_structure, 5] += attempts
+        quality[neighbourhood_structure] *= 1 - adaptation_rate
+
+        # a neighbourhood structure that found no move counts as a rejected move
+        if match1 != -1:
+            # only rescore the moved matches and their referees, before and after the move
+            new_slot1 = current_candidate[match1]
+            new_slot2 = current_candidate[match2] if match2 != -1 else -1
+            difference = move_penalty(current_candidate, current_slot_match, match1, match2, instance,
+                                      day_time_slot)
+            place_matches(current_candidate, current_slot_match, match1, old_slot1, match2, old_slot2)
+            difference -= move_penalty(current_candidate, current_slot_match, match1, match2, instance,
+                                       day_time_slot)
+
+            if difference < 0:
+                operator_statistics[neighbourhood_structure, 2] += 1
+                operator_statistics[neighbourhood_structure, 3] -= difference
+                quality[neighbourhood_structure] += adaptation_rate
+
+            if difference < 0 or (temperature > 0 and np.random.random() < np.exp(-difference / temperature)):
+                place_matches(current_candidate, current_slot_match, match1, new_slot1, match2, new_slot2)
+                current_penalty[0] += difference
+                operator_statistics[neighbourhood_structure, 1] += 1
+
+                if current_penalty[0] < best_penalty[0]:
+                    best_candidate[:] = current_candidate
+                    best_penalty[0] = current_penalty[0]
 
         temperature *= alpha
-        iteration += 1
-        plot_data.append(best_penalty_point)
+        trace[iterations] = best_penalty[0]
+        iterations += 1
+
+    return iterations, temperature
+
+
+# perform random walk in space from a candidate, decreasing temperature by alpha every iteration,
+# until temperature drops below final_temperature or max_iterations have been performed
+# the loop runs compiled in chunks, progress is printed (verbose) and emitted to stats between chunks
+# neighbourhood structures are chosen adaptively (adaptation_rate=0 keeps the uniform choice), the returned
+# operator statistics have a row per neighbourhood structure with the number of selected, accepted and
+# improving moves, the penalty points gained by improving moves, the number of times no move was found
+# and the number of random picks made (see instrumentation.OPERATOR_COLUMNS)
+# plot data holds the best penalty point after each iteration, unless the trace is passed to recorder instead
+# with a checkpoint (see checkpoint.py) the chain is saved between chunks when it is due and the compiled
+# random generator is reseeded from numpy's before every chunk, so a chain resumed from the saved state
+# (which replaces the candidate, penalty point and temperatures passed) continues exactly as the saved one
+# the chain also ends when budget (see stopping.py) says so, before every chunk cooling is sped up (alpha
+# lowered) so that final_temperature is reached before time or evaluations run out; with a time budget the
+# iteration rate is measured on a first chunk of calibration_size iterations, chunks end when the stagnation
+# limit would be reached so the chain stops after exactly that many iterations without improvement
+def markov_chain(temperature, final_temperature, alpha, max_iterations, initial_candidate, penalty_point,
+                 instance, iteration=100, verbose=True, chunk_size=5000, adaptation_rate=0.01,
+                 minimum_probability=0.05, stats=None, recorder=None, checkpoint=None, state=None, budget=None,
+                 calibration_size=500):
+    slot_no = instance.available.shape[0]
+    current_candidate = np.copy(initial_candidate)
+    best_candidate = np.copy(current_candidate)
+    current_penalty = np.array([penalty_point], dtype=np.int64)
+    best_penalty = np.array([penalty_point], dtype=np.int64)
+    day_time_slot = workspace(instance)  # scoring buffer reused by every iteration
+    trace = np.empty(chunk_size, dtype=np.int64)
+    quality = np.ones(4)
+    operator_statistics = np.zeros((4, 6), dtype=np.int64)
+    temperature = float(temperature)
+    cooling = alpha
+    iteration_rate = None  # iterations per second, measured for time budgets
+    plot_data = []
+    performed = 0
+
+    if state is not None:
+        current_candidate, best_candidate = np.copy(state["current_candidate"]), np.copy(state["best_candidate"])
+        current_penalty, best_penalty = np.copy(state["current_penalty"]), np.copy(state["best_penalty"])
+        quality, operator_statistics = np.copy(state["quality"]), np.copy(state["operator_statistics"])
+        temperature, final_temperature = float(state["temperature"]), float(state["final_temperature"])
+        performed, iteration = int(state["performed"]), int(state["iteration"])
+        cooling, iteration_rate = float(state["alpha"]), float(state["iteration_rate"]) or None
+        plot_data = [state["plot_data"]]
+    else:
+        start_phase(budget)  # a resumed chain keeps the stagnation of its checkpoint
+
+    current_slot_match = slot_index(current_candidate, slot_no)
+    start, first_performed = timer(), performed
+
+    while (max_iterations is None or performed < max_iterations) and not exhausted(budget):
+        remaining = chunk_size if max_iterations is None else min(chunk_size, max_iterations - performed)
+        remaining = min(remaining, remaining_evaluations(budget) or remaining,
+                        remaining_stagnation(budget) or remaining)
+
+        if budget is not None:
+            if budget.seconds is not None and iteration_rate is None:
+                remaining = min(remaining, calibration_size)
+
+            cooling = min(alpha, cooling_rate(budget, temperature, final_temperature, iteration_rate))
+
+        if checkpoint is not None:
+            seed(np.random.randint(2 ** 31))
+
+        iterations, temperature = \
+            chain_kernel(temperature, final_temperature, cooling, current_candidate, current_slot_match,
+                         current_penalty, best_candidate, best_penalty, instance, day_time_slot,
+                         trace[:remaining], quality, operator_statistics, adaptation_rate, minimum_probability)
+
+        if verbose:
+            for index in range(iterations):
+                if (iteration + index + 1) % 50 == 0:
+                    print("[Iteration ", iteration + index + 1, "] Penalty Point: ", trace[index], sep="")
+
+        if recorder is None:
+            plot_data.append(np.copy(trace[:iterations]))
+        else:
+            record(recorder, trace[:iterations])
+
+        performed += iterations
+        iteration += iterations
+        emit(stats, "sa", iteration=iteration, temperature=temperature, penalty_point=int(current_penalty[0]),
+             best_penalty_point=int(best_penalty[0]))
+
+        # iterations of the chunk after the best penalty point last changed (the trace only ever decreases)
+        stagnant = iterations - 1 - np.argmax(trace[:iterations] == trace[iterations - 1]) if iterations else 0
+
+        if spend(budget, iterations, best_penalty[0], stagnant) or iterations < remaining:
+            break
+
+        iteration_rate = (performed - first_performed) / (timer() - start)
 
-        if iteration % 50 == 0:
-            print("[Iteration ", iteration, "] Penalty Point: ", best_penalty_point, sep="")
+        if due(checkpoint):
+            save(checkpoint, "sa", recorder, budget, current_candidate=current_candidate,
+                 current_penalty=current_penalty, best_candidate=best_candidate, best_penalty=best_penalty,
+                 quality=quality, operator_statistics=operator_statistics, temperature=temperature,
+                 final_temperature=final_temperature, alpha=cooling, iteration_rate=iteration_rate,
+                 performed=performed, iteration=iteration,
+                 plot_data=np.concatenate(plot_data) if plot_data else np.empty(0, dtype=np.int64))
 
-    return best_candidate, best_penalty_point, plot_data
+    plot_data = np.concatenate(plot_data) if plot_data else np.empty(0, dtype=np.int64)
+    return current_candidate, int(current_penalty[0]), best_candidate, int(best_penalty[0]), temperature, plot_data, \
+        operator_statistics
+
+
+# Simulated-Annealing Algorithm - perform random walk in space until temperature drops below a limit
+# checkpoints are saved and resumed and budget is used as in markov_chain
+# an initial temperature of 0 (e.g. a GA population of equal penalty points) is replaced by a sampled one
+def anneal(initial_temperature, initial_candidate, penalty_point, instance, verbose=True, stats=None, recorder=None,
+           checkpoint=None, state=None, budget=None):
+    if initial_temperature <= 0:
+        initial_temperature = sample_temperature(initial_candidate, instance)
+
+    final_temperature = 0.0001 * initial_temperature
+    alpha = 0.9999  # annealing schedule to decrease temperature
+    _, _, best_candidate, best_penalty_point, _, plot_data, operator_statistics = \
+        markov_chain(initial_temperature, final_temperature, alpha, None, initial_candidate, penalty_point,
+                     instance, verbose=verbose, stats=stats, recorder=recorder, checkpoint=checkpoint, state=state,
+                     budget=budget)
+    return best_candidate, best_penalty_point, plot_data, operator_statistics
@@ -0,0 +1,112 @@
+from collections import namedtuple
+from timeit import default_timer as timer
+
+# stopping criteria of a run, any of them may be None
+# the run stops after seconds of wall time, after a number of penalty evaluations (GA children and SA moves)
+# or as soon as the best penalty point is at most target (e.g. a target below 1000 means no hard constraint
+# violated), a phase (GA or SA) ends after stagnation evaluations without improving the best penalty point
+# state holds the start time, evaluations so far, the best penalty point, evaluations since it improved and
+# the reason the run stopped ("seconds", "evaluations", "target" or "stagnation")
+# every function accepts None instead of a budget, so unlimited runs pay nothing
+Budget = namedtuple("Budget", ["seconds", "evaluations", "target", "stagnation", "state"])
+
+
+# create a budget, its clock starts now
+def create_budget(seconds=None, evaluations=None, target=None, stagnation=None):
+    return Budget(seconds, evaluations, target, stagnation,
+                  {"start": timer(), "evaluations": 0, "best": None, "stagnant": 0, "reason": None})
+
+
+# start a new phase, the stagnation of the previous phase does not count
+def start_phase(budget):
+    if budget is not None:
+        budget.state["stagnant"] = 0
+
+        if budget.state["reason"] == "stagnation":
+            budget.state["reason"] = None
+
+
+# check if the run must stop because its time, evaluations or target is reached
+def exhausted(budget):
+    if budget is None:
+        return False
+
+    state = budget.state
+
+    if budget.target is not None and state["best"] is not None and state["best"] <= budget.target:
+        state["reason"] = "target"
+    elif budget.evaluations is not None and state["evaluations"] >= budget.evaluations:
+        state["reason"] = "evaluations"
+    elif budget.seconds is not None and timer() - state["start"] >= budget.seconds:
+        state["reason"] = "seconds"
+
+    return state["reason"] is not None and state["reason"] != "stagnation"
+
+
+# count evaluations after which best_penalty_point is the best penalty point of the phase, stagnant is the number of
+# those evaluations made after the best penalty point last improved (0 if not given)
+# returns True if the run or phase must stop
+def spend(budget, evaluations, best_penalty_point, stagnant=0):
+    if budget is None:
+        return False
+
+    state = budget.state
+    state["evaluations"] += int(evaluations)
+
+    if state["best"] is None or best_penalty_point < state["best"]:
+        state["best"] = int(best_penalty_point)
+        state["stagnant"] = int(stagnant)
+    else:
+        state["stagnant"] += int(evaluations)
+
+    if exhausted(budget):
+        return True
+
+    if budget.stagnation is not None and state["stagnant"] >= budget.stagnation:
+        state["reason"] = "stagnation"
+        return True
+
+    return False
+
+
+# evaluations a phase may still make without improving before it stops, None if stagnation is not limited
+def remaining_stagnation(budget):
+    if budget is None or budget.stagnation is None:
+        return None
+
+    return max(budget.stagnation - budget.state["stagnant"], 1)
+
+
+# evaluations left before the run stops, None if they are not limited
+def remaining_evaluations(budget):
+    if budget is None or budget.evaluations is None:
+        return None
+
+    return max(budget.evaluations - budget.state["evaluations"], 0)
+
+
+# geometric cooling rate that takes temperature to final_temperature when the budget runs out, given the number
+# of iterations performed per second (None leaves time out until the rate is measured), 1.0 (no cooling needed to
+# finish in time) if time and evaluations are not limited
+def cooling_rate(budget, temperature, final_temperature, iteration_rate):
+    iterations = []
+
+    if budget is not None and budget.seconds is not None and iteration_rate is not None:
+        iterations.append((budget.seconds - (timer() - budget.state["start"])) * iteration_rate)
+
+    if remaining_evaluations(budget) is not None:
+        iterations.append(remaining_evaluations(budget))
+
+    if not iterations or temperature <= final_temperature:
+        return 1.0
+
+    return (final_temperature / temperature) ** (1 / max(min(iterations), 1))
+
+
+# continue a budget from the state saved with a checkpoint (see checkpoint.save), the time spent before the
+# checkpoint counts against seconds
+def resume_budget(budget, arrays):
+    if budget is not None and "budget_state" in arrays:
+        elapsed, evaluations, best, has_best, stagnant = arrays["budget_state"]
+        budget.state.update(start=timer() - elapsed, evaluations=int(evaluations),
+                            best=int(best) if has_best else None, stagnant=int(stagnant))